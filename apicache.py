@@ -0,0 +1,214 @@
+"""
+Overview: The following code is the caching layer that sits underneath request_the_api in obtaindata.py. Every CFBD response is stored
+under a key made from the endpoint plus the normalized parameters, so two users asking about the same team and year only pay for the
+api round trips once. There are two tiers. The first tier is an in-memory LRU that answers repeat requests within the same process and
+the second tier is a SQLite file on disk holding zlib compressed JSON so the cache survives restarts and is shared between workers.
+Each entry carries a time to live that depends on the endpoint and on whether the season is finished, since past seasons never change
+but the current season does. Concurrent identical misses are deduplicated (single-flight) so only one upstream call is made and the
+other threads wait on its result. Hit, miss and eviction counters are kept so they can be scraped from the flask app.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import closing
+
+"""
+Time to live values in seconds for each endpoint. The first value is used for the current season and the second value is used for a finished
+season. Endpoints that are not listed fall back to DEFAULT_TTLS.
+"""
+HOUR= 60 * 60
+DAY= 24 * HOUR
+ENDPOINT_TTLS= {
+    'player/usage': (6 * HOUR, 90 * DAY),
+    'ppa/players/season': (6 * HOUR, 90 * DAY),
+    'stats/player/season': (6 * HOUR, 90 * DAY),
+    'records': (HOUR, 90 * DAY),
+}
+DEFAULT_TTLS= (HOUR, 30 * DAY)
+
+"""
+The following function decides if a season is still being played. A college football season that starts in a given year runs until the
+national championship in January of the next year, so a season is only treated as finished once February of the following year arrives.
+If the year can't be read the season is treated as current so the shorter time to live is used.
+"""
+def season_is_current(year, today=None):
+    today= today or datetime.date.today()
+    try:
+        year= int(year)
+    except (TypeError, ValueError):
+        return True
+    if year >= today.year:
+        return True
+    return year == today.year - 1 and today.month < 2
+
+def ttl_for(endpoint, params):
+    current_ttl, finished_ttl= ENDPOINT_TTLS.get(endpoint, DEFAULT_TTLS)
+    if season_is_current((params or {}).get('year')):
+        return current_ttl
+    return finished_ttl
+
+"""
+Parameters arrive from flask forms as strings and from the code as ints, so normalize_params turns every value into a stripped string and drops
+parameters that are None, and the key is made from the normalized parameters with the names sorted. This way {'year': 2023} and {'year': '2023'}
+share one cache entry. The same normalized parameters have to be sent to the api, otherwise the response for 'Alabama ' would be stored under the
+key of 'Alabama'.
+"""
+def normalize_params(params):
+    return {str(name): str(value).strip() for name, value in (params or {}).items() if value is not None}
+
+def make_cache_key(endpoint, params):
+    return endpoint.strip('/') + '?' + json.dumps(normalize_params(params), sort_keys=True, separators=(',', ':'))
+
+"""
+The ResponseCache class holds both tiers and the single-flight bookkeeping. get_or_fetch is the only method request_the_api needs. It first
+looks in memory, then on disk and only if both miss does it call fetch. A failed fetch (None) is never cached so the next request tries again.
+The memory tier is checked once more while holding the lock before a thread becomes the one that fetches, since another thread's fetch may have
+finished in between. Threads that wait on another thread's fetch are counted as hits (and under coalesced) because they didn't call the api.
+The disk tier opens a short lived connection for each operation, which keeps it safe to use from the thread pool and from forked workers.
+"""
+class ResponseCache:
+    def __init__(self, db_path=None, max_entries=256, ttl_function=ttl_for):
+        self.db_path= db_path
+        self.max_entries= max_entries
+        self.ttl_function= ttl_function
+        self._memory= OrderedDict()
+        self._lock= threading.Lock()
+        self._in_flight= {}
+        self._counters= {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'coalesced': 0, 'errors': 0}
+        if self.db_path:
+            directory= os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with closing(self._connect()) as connection, connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, "
+                                   "expires_at REAL NOT NULL, payload BLOB NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name]+= amount
+
+    def stats(self):
+        with self._lock:
+            stats= dict(self._counters)
+            stats['memory_entries']= len(self._memory)
+            stats['in_flight']= len(self._in_flight)
+        lookups= stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio']= (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _memory_get(self, key, now):
+        with self._lock:
+            return self._memory_lookup(key, now)
+
+    def _memory_lookup(self, key, now):
+        entry= self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value= entry
+        if expires_at <= now:
+            del self._memory[key]
+            self._counters['expired']+= 1
+            return None
+        self._memory.move_to_end(key)
+        self._counters['hits']+= 1
+        return value
+
+    def _memory_put(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key]= (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._counters['evictions']+= 1
+
+    def _disk_get(self, key, now):
+        if not self.db_path:
+            return None
+        try:
+            with closing(self._connect()) as connection:
+                row= connection.execute("SELECT expires_at, payload FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Cache read error: {e}")
+            self._count('errors')
+            return None
+        if row is None:
+            return None
+        expires_at, payload= row
+        if expires_at <= now:
+            self._count('expired')
+            return None
+        self._count('disk_hits')
+        return expires_at, json.loads(zlib.decompress(payload))
+
+    def _disk_put(self, key, endpoint, value, expires_at, now):
+        if not self.db_path:
+            return
+        payload= zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("INSERT OR REPLACE INTO responses (key, endpoint, expires_at, payload) VALUES (?, ?, ?, ?)",
+                                   (key, endpoint, expires_at, payload))
+                connection.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as e:
+            print(f"Cache write error: {e}")
+            self._count('errors')
+
+    def get_or_fetch(self, endpoint, params, fetch):
+        key= make_cache_key(endpoint, params)
+        now= time.time()
+        value= self._memory_get(key, now)
+        if value is not None:
+            return value
+        disk_entry= self._disk_get(key, now)
+        if disk_entry is not None:
+            expires_at, value= disk_entry
+            self._memory_put(key, value, expires_at)
+            return value
+
+        with self._lock:
+            value= self._memory_lookup(key, time.time())
+            if value is not None:
+                return value
+            waiter= self._in_flight.get(key)
+            if waiter is None:
+                waiter= {'done': threading.Event(), 'value': None}
+                self._in_flight[key]= waiter
+                leader= True
+            else:
+                self._counters['coalesced']+= 1
+                leader= False
+        if not leader:
+            waiter['done'].wait()
+            self._count('hits' if waiter['value'] is not None else 'misses')
+            return waiter['value']
+
+        self._count('misses')
+        try:
+            value= fetch()
+            if value is not None:
+                now= time.time()
+                expires_at= now + self.ttl_function(endpoint, params)
+                self._memory_put(key, value, expires_at)
+                self._disk_put(key, endpoint, value, expires_at, now)
+            waiter['value']= value
+            return value
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            waiter['done'].set()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.db_path:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("DELETE FROM responses")
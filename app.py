@@ -3,7 +3,8 @@ app.py's purpose is to monitor the coherencey of all the steps in the web applic
 handling a variety of things. Importing os and load_dotenv serve the purpose of providing access to the env file with the api keys. The openai and time
 libraries deal with the handling of the chatgpt request. The get_team_data import creates a detailed png image utilizing the data of a team from
 a year that the user provided. get_team_data also provides a sorted_players list and team_info dictionary. Flask is imported to manage the functionality of the 
-system. After the libraries are imported, budget variables are listed for monitoring the cost of the chatgpt requests. Then this module is made the flask application, the
+system. After the libraries are imported, budget variables are listed for monitoring the cost of the chatgpt requests. The money spent is kept in a
+SharedBudget from limits.py so every worker process spends from the same budget (CHATGPT_BUDGET changes the limit and CHATGPT_BUDGET_PERIOD how often it starts over). Then this module is made the flask application, the
 environment variable is loaded in and a client is made utilizing an openai api key. The route signfies that when a user navigates to http://127.0.0.1:5000/,
 the home function should handle GET and POST methods since the home function follows the decorator. Until a user submits a form, flask will render
 the index.html template. Once a user submits a form, flask will handle the request and retrieve the team and year. The sorted_players list and team_info 
@@ -15,37 +16,82 @@ too long of a response. The formatting of the chatgpt request was made available
 and allowed for me to understand the chatgpt error checking. Given a response was received from the chatgpt request and no other issues persist, flask will render 
 the results.html template to the user. The user is then given some info about the data and flasks's url_for function is used to navigate to a route that retrieves the football 
 field png image. The detailed football image the user asked for will then be portrayed and chatgpt will offer even more info on 
-the user's football team in a specified year below the football field.
+the user's football team in a specified year below the football field. Every chatgpt summary is saved in a summary cache keyed by the model, team, year
+and prompt version, so a repeat query shows the saved summary right away without paying for a new one. When the CHATGPT_STREAMING env variable is set
+to 1, the results page is rendered as soon as the field and stats are ready and the chatgpt summary streams into the page through server-sent events
+from the summary stream route. Each stage of a request is timed with metrics.py and the numbers are served in the Prometheus format from the
+metrics route. The OpenAI client reads the OPENAI_BASE_URL env variable, which allows it to be pointed at a local fake endpoint. The compare route
+returns the top players, a per stat category breakdown and the record of many team-seasons at once as JSON (see compare.py).
 """
 import os
+import json
 from dotenv import load_dotenv
 import openai
-from flask import Flask, request, render_template, send_file
-from obtaindata import get_team_data
+from flask import Flask, request, render_template, send_file, jsonify, Response, stream_with_context, url_for, g, abort
+from obtaindata import get_team_data, response_cache, cfbd_headers
+from compare import compare_team_seasons
+from usageindex import USAGE_SPLITS, SPLIT_ALIASES
+from summarycache import SummaryCache
+from limits import SharedBudget, SharedTokenBucket
+import metrics
 import time
 
 load_dotenv()
 client= openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 app= Flask(__name__)
 
-budget_lim= 5.00
+budget_lim= float(os.getenv('CHATGPT_BUDGET', '5.00'))
 cost_per_1000_input_tokens= 0.005
 cost_per_1000_output_tokens= 0.015
-total_cost_used= 0
+max_tokens= 750
+budget= SharedBudget('openai', budget_lim, period=os.getenv('CHATGPT_BUDGET_PERIOD', 'month'))
+openai_rate_limit= float(os.getenv('OPENAI_RATE_LIMIT', '0'))
+openai_limiter= SharedTokenBucket('openai', openai_rate_limit) if openai_rate_limit else None
+
+chatgpt_model= "gpt-4o"
+prompt_version= 1
+chatgpt_streaming= os.getenv('CHATGPT_STREAMING', '0') == '1'
+summary_cache= SummaryCache(os.getenv('CHATGPT_CACHE_PATH', os.path.join('cache', 'chatgpt_summaries.sqlite3')))
+metrics.watch_cache('chatgpt', summary_cache)
+server_timing= os.getenv('METRICS_SERVER_TIMING', '0') == '1'
+
+"""
+Every request starts with an empty list of stage timings. After the request is answered its duration is added to the http_request_seconds
+histogram and, when the METRICS_SERVER_TIMING env variable is 1, the timings of each stage are sent back in the Server-Timing header.
+"""
+@app.before_request
+def start_timing():
+    g.request_started= time.perf_counter()
+    metrics.start_request_timing()
+
+@app.after_request
+def finish_timing(response):
+    if metrics.metrics_enabled and 'request_started' in g:
+        elapsed= time.perf_counter() - g.request_started
+        route= request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.request_seconds.observe(elapsed, route=route, method=request.method, status=response.status_code)
+        if server_timing:
+            response.headers['Server-Timing']= metrics.server_timing_header(elapsed)
+    return response
 
 @app.route('/', methods=['GET', 'POST'])
 def home():
-    global total_cost_used
     if request.method == 'POST':
         team = request.form['team']
         year= request.form['year']
         sorted_players, team_info= get_team_data(year,team)
         if sorted_players and team_info:
-            remaining_budget= budget_lim - total_cost_used
-            if remaining_budget > 0:
-                chatgpt_response, cost_used = get_chatgpt_response(team,year)
-                if cost_used > 0:
-                    total_cost_used += cost_used
+            cached_response= summary_cache.get(chatgpt_model, team, year, prompt_version)
+            if cached_response is not None:
+                return render_template('results.html', players=sorted_players, team_info=team_info, chatgpt_response=cached_response, year=year)
+            remaining_budget= budget.remaining()
+            if remaining_budget >= estimate_chatgpt_cost(build_chatgpt_messages(team, year)):
+                stream_token= summary_cache.add_pending_stream(team, year) if chatgpt_streaming else None
+                if stream_token is not None:
+                    return render_template('results.html', players=sorted_players, team_info=team_info, chatgpt_response=None, year=year,
+                                           summary_stream_url=url_for('summary_stream', token=stream_token))
+                chatgpt_response, cost_used = get_chatgpt_response(team,year,check_cache=False)
+                if chatgpt_response is not None:
                     return render_template('results.html', players=sorted_players, team_info=team_info, chatgpt_response=chatgpt_response, year=year)
                 else:
                     return render_template('index.html', error="Unable to get a response from ChatGPT.")
@@ -55,45 +101,238 @@ def home():
             return render_template('index.html', error="Unable to retrieve data for specified team and year.")
     return render_template('index.html')
 
-def get_chatgpt_response(team, year):
+"""
+The cache stats route returns the hit, miss and eviction counters of the CFBD response cache as JSON so they can be scraped. The metrics route
+returns every metric in the Prometheus text format: the stage latency histograms, the upstream status codes, the cache hit ratios and the
+OpenAI tokens and cost. The numbers are the totals of every worker process (through the shared METRICS_PATH file), not just the worker that
+answers the scrape.
+"""
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/metrics')
+def metrics_route():
+    return Response(metrics.registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+"""
+The compare route answers /api/compare?teams=Alabama,Georgia&years=2022,2023 (or conference=SEC instead of teams, or neither for every team).
+n is the number of players per team (at most max_compare_players) and split is the usage split to rank by. Bad parameters get a 400 with an
+error message and the response lists the team-seasons that had no players under missing.
+"""
+max_compare_players= 25
+max_compare_years= 10
+
+def split_parameter(name):
+    return [value.strip() for value in request.args.get(name, '').split(',') if value.strip()]
+
+@app.route('/api/compare')
+def compare_route():
+    teams= split_parameter('teams')
+    years= split_parameter('years')
+    conference= request.args.get('conference') or None
+    split= request.args.get('split', 'overall')
+    if not years or not all(year.isdigit() for year in years):
+        return jsonify(error="years must be a comma separated list of seasons."), 400
+    if len(years) > max_compare_years:
+        return jsonify(error=f"At most {max_compare_years} years can be compared at once."), 400
+    if SPLIT_ALIASES.get(split, split) not in USAGE_SPLITS:
+        return jsonify(error=f"Unknown usage split: {split}"), 400
+    try:
+        n= int(request.args.get('n', 5))
+    except ValueError:
+        return jsonify(error="n must be a whole number."), 400
+    if not 1 <= n <= max_compare_players:
+        return jsonify(error=f"n must be between 1 and {max_compare_players}."), 400
+    headers= cfbd_headers()
+    if headers is None:
+        return jsonify(error="The CFBD api key is missing."), 500
+    comparison= compare_team_seasons(headers, [int(year) for year in years], teams=teams or None, conference=conference, n=n, split=split)
+    return jsonify(comparison)
+
+"""
+The following helpers are shared by the blocking and the streaming chatgpt requests. build_chatgpt_messages makes the prompt for a team and
+year (prompt_version has to be bumped whenever the wording changes so old summaries aren't shown for the new prompt) and chatgpt_cost turns
+the tokens used into dollars. estimate_chatgpt_cost is the most a request could cost, which is what gets reserved from the shared budget before the
+request is made. A token is never shorter than one character, so the length of the prompt plus a few tokens per message is an upper bound on the
+prompt tokens, and the completion can't be longer than max_tokens.
+"""
+def build_chatgpt_messages(team, year):
+    return [
+        {"role": "system", "content": "You are an extremely useful assistant."},
+        {"role": "user", "content": f"Tell me about {team} football team's performance in the {year} season."}
+    ]
+
+def chatgpt_cost(prompt_tokens_used, completion_tokens_used):
+    return (prompt_tokens_used / 1000) * cost_per_1000_input_tokens + (completion_tokens_used/1000) * cost_per_1000_output_tokens
+
+def estimate_chatgpt_cost(messages):
+    prompt_tokens_bound= sum(len(message['content']) + 10 for message in messages)
+    return chatgpt_cost(prompt_tokens_bound, max_tokens)
+
+"""
+The summary stream route sends the chatgpt summary to the results page as server-sent events while the completion is still being written. It only
+exists when CHATGPT_STREAMING is 1 (a 404 is returned otherwise) and it doesn't take a team or year: home() checks the team and year with CFBD first
+and then hands the page a one-time token from summary_cache.add_pending_stream, which the stream trades back for the team and year. An unknown, used or
+expired token gets a 404, so the route can't be used to spend the budget on made up prompts. Each
+piece of text is sent as a delta event and a done event is sent at the end, or a failed event if the summary couldn't be made. A saved summary is
+sent whole as a summary event. The estimated cost is reserved from the shared budget before the completion starts. The usage of the streamed
+completion is requested with stream_options so the real cost can be committed to the budget, and the finished summary is saved to the summary
+cache even when no usage arrived (with 0 tokens), unless it came back empty. The reservation is only released when the completion couldn't be started. Once OpenAI has started writing, the tokens are billed even if the
+stream fails or the browser goes away (which closes the generator), so the finally block closes the stream and commits the real cost, or the
+estimated cost when no usage arrived.
+"""
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def record_stream_error(e):
+    print(f"OpenAI returned an API Error while streaming: {e}")
+    if not isinstance(e, openai.RateLimitError):
+        metrics.record_upstream_status('openai', getattr(e, 'status_code', 'error'))
+
+@app.route('/summary/stream')
+def summary_stream():
+    if not chatgpt_streaming:
+        abort(404)
+    pending_stream= summary_cache.take_pending_stream(request.args.get('token', ''))
+    if pending_stream is None:
+        abort(404)
+    team, year= pending_stream
+
+    def events():
+        cached_response= summary_cache.get(chatgpt_model, team, year, prompt_version)
+        if cached_response is not None:
+            yield server_sent_event('summary', {'text': cached_response})
+            yield server_sent_event('done', {'cost': 0})
+            return
+        messages= build_chatgpt_messages(team, year)
+        estimated_cost= estimate_chatgpt_cost(messages)
+        reservation_id= budget.reserve(estimated_cost)
+        if reservation_id is None:
+            yield server_sent_event('failed', {'message': "Budget limit exceeded."})
+            return
+        with metrics.span('chatgpt_stream'):
+            try:
+                stream= create_chatgpt_completion(messages, stream=True, stream_options={"include_usage": True})
+            except openai.OpenAIError as e:
+                budget.release(reservation_id)
+                record_stream_error(e)
+                yield server_sent_event('failed', {'message': "Unable to get a response from ChatGPT."})
+                return
+            pieces= []
+            usage= None
+            finished= False
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        pieces.append(chunk.choices[0].delta.content)
+                        yield server_sent_event('delta', {'text': chunk.choices[0].delta.content})
+                    if chunk.usage is not None:
+                        usage= chunk.usage
+                metrics.record_upstream_status('openai', 200)
+                finished= True
+            except openai.OpenAIError as e:
+                record_stream_error(e)
+            finally:
+                stream.close()
+                if usage is not None:
+                    cost_used= chatgpt_cost(usage.prompt_tokens, usage.completion_tokens)
+                    metrics.record_openai_usage(usage.prompt_tokens, usage.completion_tokens, cost_used)
+                else:
+                    cost_used= estimated_cost
+                budget.commit(reservation_id, cost_used)
+        if not finished:
+            yield server_sent_event('failed', {'message': "Unable to get a response from ChatGPT."})
+            return
+        chatgpt_response= "".join(pieces).strip()
+        if not chatgpt_response:
+            yield server_sent_event('failed', {'message': "Unable to get a response from ChatGPT."})
+            return
+        summary_cache.put(chatgpt_model, team, year, prompt_version, chatgpt_response, usage.prompt_tokens if usage else 0,
+                          usage.completion_tokens if usage else 0)
+        yield server_sent_event('done', {'cost': cost_used})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+"""
+create_chatgpt_completion requests a completion for both the blocking and the streaming summary (waiting for a token from the shared OpenAI rate
+limiter when OPENAI_RATE_LIMIT is set). When a 429 error is returned it waits 2, 4, 8 and 16 seconds between tries and raises the RateLimitError
+if the fifth try is turned away too. A streamed completion is turned away before any text is sent, so retrying it the same way is safe.
+"""
+max_attempts= 5
+
+def create_chatgpt_completion(messages, **options):
     attempt= 0
-    max_attempts= 5
-    max_tokens= 750
-    while attempt < max_attempts:
+    while True:
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an extremely useful assistant."},
-                    {"role": "user", "content": f"Tell me about {team} football team's performance in the {year} season."}
-                ],
-                max_tokens=max_tokens
+            if openai_limiter is not None:
+                openai_limiter.acquire()
+            return client.chat.completions.create(
+                model=chatgpt_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                **options
             )
-            prompt_tokens_used= response.usage.prompt_tokens
-            completion_tokens_used= response.usage.completion_tokens
-
-            cost_used= (prompt_tokens_used / 1000) * cost_per_1000_input_tokens + (completion_tokens_used/1000) * cost_per_1000_output_tokens
-
-            return response.choices[0].message.content.strip(), cost_used
-        except openai.RateLimitError as e:
+        except openai.RateLimitError:
             attempt+=1
+            metrics.record_upstream_status('openai', 429)
+            if attempt >= max_attempts:
+                raise
             print("An 429 error has occured")
             print(f"Retrying in {2 ** attempt} seconds..")
             time.sleep(2 ** attempt)
-            pass
-        except openai.APIConnectionError as e:
-            print("An API connection error has occured")
-            print(e.__cause__)
-            break
-        except openai.APIError as e:
-            print("Another non-200-range status code was received")
-            print(e.http_status)
-            time.sleep(e.response)
-            break
-        except openai.OpenAIError as e:
-            print(f"OpenAI returned an API Error: {e}")
-            break
-    return "Error: Could not produce response due to rate limit or other errors", 0
+
+"""
+get_chatgpt_response makes the blocking chatgpt request. A summary that is already in the summary cache is returned with a cost of 0 (check_cache
+is False when the caller has just looked in the cache itself). Otherwise the estimated cost is reserved from the shared budget, which every worker
+process spends from, and None is returned if the budget can't cover it. The completion is then requested with create_chatgpt_completion, which
+retries with a growing wait when a 429 error is returned. The real cost is committed to the budget and
+the new summary is saved to the summary cache. An empty summary is still paid for but isn't saved or shown. If no summary could be made the reservation is released and None is returned.
+"""
+def get_chatgpt_response(team, year, check_cache=True):
+    if check_cache:
+        cached_response= summary_cache.get(chatgpt_model, team, year, prompt_version)
+        if cached_response is not None:
+            return cached_response, 0
+    messages= build_chatgpt_messages(team, year)
+    reservation_id= budget.reserve(estimate_chatgpt_cost(messages))
+    if reservation_id is None:
+        print("Budget limit exceeded")
+        return None, 0
+    try:
+        with metrics.span('chatgpt'):
+            response = create_chatgpt_completion(messages)
+        metrics.record_upstream_status('openai', 200)
+        prompt_tokens_used= response.usage.prompt_tokens
+        completion_tokens_used= response.usage.completion_tokens
+
+        cost_used= chatgpt_cost(prompt_tokens_used, completion_tokens_used)
+        budget.commit(reservation_id, cost_used)
+        reservation_id= None
+        metrics.record_openai_usage(prompt_tokens_used, completion_tokens_used, cost_used)
+
+        chatgpt_response= (response.choices[0].message.content or "").strip()
+        if not chatgpt_response:
+            print("ChatGPT returned an empty summary")
+            return None, cost_used
+        summary_cache.put(chatgpt_model, team, year, prompt_version, chatgpt_response, prompt_tokens_used, completion_tokens_used)
+        return chatgpt_response, cost_used
+    except openai.RateLimitError:
+        print(f"Still receiving 429 errors after {max_attempts} attempts")
+    except openai.APIConnectionError as e:
+        metrics.record_upstream_status('openai', 'error')
+        print("An API connection error has occured")
+        print(e.__cause__)
+    except openai.APIStatusError as e:
+        metrics.record_upstream_status('openai', e.status_code)
+        print("Another non-200-range status code was received")
+        print(e.status_code)
+    except openai.OpenAIError as e:
+        print(f"OpenAI returned an API Error: {e}")
+    finally:
+        if reservation_id is not None:
+            budget.release(reservation_id)
+    return None, 0
 
 if __name__ == '__main__':
     app.run(debug=True) 
@@ -0,0 +1,4 @@
+"""
+The benchmarks package holds scripts that measure the speed of the data layer offline. Each script is run from the root of the repository,
+for example python -m benchmarks.bench_usage.
+"""
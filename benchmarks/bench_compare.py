@@ -0,0 +1,75 @@
+"""
+Overview: The following code measures the comparison api against the local stub server. It compares every team of a season (130 teams by default)
+two ways: team by team with fetch_team_data and generate_stats_info, which is what a client looping over get_team_data would cost, and with a single
+compare_team_seasons call. Both are run cold (empty response cache) and warm (payloads and season tables already built). The in-memory
+cache is made big enough to hold every per team response so the warm team by team sweep isn't measuring evictions. Before timing, the
+top players, averagePPA, YDS and TD of a few teams are checked against the per team pipeline so the vectorized lookups can't drift from it.
+Run it with python -m benchmarks.bench_compare.
+"""
+import argparse
+import math
+import os
+import time
+from benchmarks.stub_server import StubCFBDServer
+
+def per_team_sweep(obtaindata, year, teams):
+    results= []
+    for team in teams:
+        sorted_players, team_info= obtaindata.fetch_team_data({}, year, team)
+        if sorted_players:
+            stats_text= [obtaindata.generate_stats_info(player, obtaindata.obtain_playerST_category(player.get('position')))
+                         for player in sorted_players]
+            results.append((team, sorted_players, stats_text, team_info))
+    return results
+
+def check_against_pipeline(obtaindata, compare, year, teams):
+    comparison= {result['team']: result for result in compare.compare_team_seasons({}, [year], teams=teams)['results']}
+    for team, sorted_players, _, team_info in per_team_sweep(obtaindata, year, teams):
+        compared= comparison[team]
+        if [player['name'] for player in sorted_players] != [player['name'] for player in compared['players']]:
+            raise SystemExit(f"{team}: top players differ")
+        if compared['record'] != team_info.get('total'):
+            raise SystemExit(f"{team}: record differs")
+        for player, compared_player in zip(sorted_players, compared['players']):
+            category= obtaindata.obtain_playerST_category(player.get('position'))
+            player_stats= [stat for stat in player.get('stats', []) if stat['category'] == category]
+            expected= (float(player.get('averagePPA', 0.0)), sum(float(stat['stat']) for stat in player_stats if stat['statType'] == 'YDS'),
+                       sum(float(stat['stat']) for stat in player_stats if stat['statType'] == 'TD'))
+            found= (compared_player['averagePPA'], compared_player['YDS'], compared_player['TD'])
+            if not all(math.isclose(a, b) for a, b in zip(expected, found)):
+                raise SystemExit(f"{team} {player['name']}: expected {expected}, found {found}")
+
+def timed(function):
+    start= time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def main():
+    parser= argparse.ArgumentParser(description="Benchmark the comparison api against a local stub server")
+    parser.add_argument('--delay', type=float, default=0.02, help="seconds the stub server waits before each response")
+    parser.add_argument('--year', type=int, default=2023)
+    args= parser.parse_args()
+
+    server= StubCFBDServer(delay=args.delay).start()
+    os.environ['CFBD_API_URL']= server.url
+    import obtaindata
+    import compare
+    obtaindata.response_cache= obtaindata.ResponseCache(db_path=None, max_entries=4096)
+    try:
+        teams= obtaindata.get_usage_index({}, args.year).teams()
+        check_against_pipeline(obtaindata, compare, args.year, teams[:10])
+        print(f"stub latency {args.delay * 1e3:.0f} ms per request, {len(teams)} teams")
+        for label, function in (("team by team", lambda: per_team_sweep(obtaindata, args.year, teams)),
+                                ("compare_team_seasons", lambda: compare.compare_team_seasons({}, [args.year], teams=teams))):
+            obtaindata.response_cache.clear()
+            compare.season_tables.clear()
+            server.reset_counts()
+            cold= timed(function)
+            cold_requests= server.counts['requests']
+            warm= timed(function)
+            print(f"{label:<22} cold {cold * 1e3:9.1f} ms ({cold_requests:4d} requests)   warm {warm * 1e3:8.1f} ms")
+    finally:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Overview: The following code measures how long the CFBD data layer takes to gather one team's data against the local stub server. The old
+pipeline is reproduced in sequential_team_data exactly as get_team_data used to run it: a bare requests.get (a new connection) for every call,
+one ppa and one stats request per player and the three phases (usage, players, records) one after another. It is compared with fetch_team_data,
+which uses the pooled session, team-level requests and runs the records request alongside the usage phase. The response cache is turned off
+for the measurement so every run goes to the stub server. Run it with python -m benchmarks.bench_pipeline.
+"""
+import argparse
+import os
+import statistics
+import time
+import requests
+from benchmarks.stub_server import StubCFBDServer
+
+def sequential_team_data(api_url, year, team):
+    def get(endpoint, params):
+        the_response= requests.get(api_url + endpoint, params=params)
+        return the_response.json() if the_response.status_code == 200 else None
+    usage_data= get('player/usage', {'year': year})
+    players_from_team= [player for player in usage_data if player.get('team') == team]
+    sorted_players= sorted(players_from_team, key=lambda x: x.get('usage', {}).get('overall', 0.0), reverse=True)[:5]
+    for player in sorted_players:
+        category= {'WR': 'receiving', 'TE': 'receiving', 'QB': 'passing', 'RB': 'rushing'}.get(player['position'], 'unknown')
+        get('ppa/players/season', {'year': year, 'team': team, 'player': player['name']})
+        get('stats/player/season', {'year': year, 'team': team, 'category': category})
+    records_data= get('records', {'year': year, 'team': team})
+    return sorted_players, records_data[0]
+
+def measure(label, function, server, runs):
+    server.reset_counts()
+    timings= []
+    for _ in range(runs):
+        start= time.perf_counter()
+        sorted_players, team_info= function()
+        timings.append(time.perf_counter() - start)
+        if not sorted_players or not team_info:
+            raise SystemExit(f"{label} returned no data")
+    print(f"{label:<22} median {statistics.median(timings) * 1e3:8.1f} ms   requests/run {server.counts['requests'] / runs:5.1f}"
+          f"   connections/run {server.counts['connections'] / runs:5.1f}")
+    return statistics.median(timings)
+
+def main():
+    parser= argparse.ArgumentParser(description="Benchmark the CFBD data layer against a local stub server")
+    parser.add_argument('--delay', type=float, default=0.05, help="seconds the stub server waits before each response")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--team', default='Team 007')
+    args= parser.parse_args()
+
+    server= StubCFBDServer(delay=args.delay).start()
+    os.environ['CFBD_API_URL']= server.url
+    import obtaindata
+    obtaindata.response_cache= obtaindata.ResponseCache(db_path=None, max_entries=0)
+    try:
+        print(f"stub latency {args.delay * 1e3:.0f} ms per request, {args.runs} runs")
+        old= measure("sequential (old)", lambda: sequential_team_data(server.url, 2023, args.team), server, args.runs)
+        new= measure("pooled + parallel", lambda: obtaindata.fetch_team_data({}, 2023, args.team), server, args.runs)
+        print(f"latency reduction: {(1 - new / old) * 100:.0f}%")
+    finally:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
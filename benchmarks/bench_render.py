@@ -0,0 +1,113 @@
+"""
+Overview: The following code measures how many field images per second victoryformation can draw and how much memory it needs. The old
+renderer is copied here as pyplot_victoryformation exactly as it was written before the Figure/FigureCanvasAgg version (it opens football.jpg
+and goes through pyplot and savefig on every call). Each renderer runs in its own child process so the peak RSS reported for one isn't mixed
+up with the other. The new renderer is measured writing a png file, writing into an in-memory png buffer and, if asked, on the cfb_field.webp
+background. Run it with python -m benchmarks.bench_render.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+def sample_players():
+    positions= ('QB', 'RB', 'WR', 'WR', 'TE')
+    return [{'name': f"Player {number}", 'position': position, 'team': 'Kentucky', 'usage': {'overall': 0.4 - number * 0.07},
+             'averagePPA': 0.2 + number * 0.05,
+             'stats': [{'player': f"Player {number}", 'category': category, 'statType': stat_type, 'stat': str(stat)}
+                       for category in ('passing', 'rushing', 'receiving') for stat_type, stat in (('YDS', 1000 - number * 100), ('TD', 10 - number))]}
+            for number, position in enumerate(positions)]
+
+SAMPLE_TEAM_INFO= {'team': 'Kentucky', 'conference': 'SEC', 'total': {'wins': 9, 'losses': 4, 'ties': 0}}
+
+def pyplot_victoryformation(players_data, team_info, output_path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from PIL import Image
+    from obtaindata import obtain_playerST_category, generate_stats_info
+    plt.figure(figsize=(12,8))
+    field_img= Image.open('static/football.jpg')
+    plt.imshow(field_img)
+
+    player_num= len(players_data)
+    space= field_img.height/(player_num+1)
+
+    for i, player in enumerate(players_data):
+        usage_rate= player.get('usage', {}).get('overall', 0.0)
+        ppa= player.get('averagePPA', 0.0)
+        y_coord= field_img.height - (i+1) * space
+        plt.scatter(100, y_coord, color='red', s=50, marker='o')
+
+        main_info= f"{player.get('name', 'Unknown')}\nUsage Rate: {usage_rate:.4f}\nAvg. PPA: {ppa:.4f}"
+        player_position= player.get('position', 'Unknown')
+        player_category= obtain_playerST_category(player_position)
+        ydtd_info= generate_stats_info(player, player_category)
+
+        plt.text(125, y_coord, main_info, fontsize=10, color='black', ha='left', va='center', fontweight='bold')
+        plt.text(350, y_coord, ydtd_info, fontsize=10, color='black',  ha='left', va='center', fontweight='bold')
+    team_annotation= f"Team: {team_info.get('team', 'Unknown')}\nConference: {team_info.get('conference', 'Unknown')}\nRecord: {team_info.get('total', {}).get('wins', 'Unknown')}-{team_info.get('total', {}).get('losses', 'Unknown')}-{team_info.get('total', {}).get('ties', 'Unknown')}"
+    plt.text(field_img.width - 10, field_img.height-10, team_annotation, fontsize=10, color='black', ha='right', va='top', fontweight='bold')
+    plt.xlim(0, field_img.width)
+    plt.ylim(0, field_img.height)
+    plt.savefig(output_path)
+    plt.close()
+
+"""
+run_renderer is what each child process runs. Importing obtaindata is done before the clock starts, so the one time decode of the background
+counts towards peak RSS but not towards renders per second. ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+"""
+def run_renderer(path, renders):
+    players_data= sample_players()
+    with tempfile.TemporaryDirectory() as directory:
+        output_path= os.path.join(directory, 'field.png')
+        if path == 'pyplot':
+            render= lambda: pyplot_victoryformation(players_data, SAMPLE_TEAM_INFO, output_path)
+        else:
+            from obtaindata import victoryformation
+            if path == 'buffer':
+                render= lambda: victoryformation(players_data, SAMPLE_TEAM_INFO, None)
+            else:
+                render= lambda: victoryformation(players_data, SAMPLE_TEAM_INFO, output_path)
+        render()
+        start= time.perf_counter()
+        for _ in range(renders):
+            render()
+        elapsed= time.perf_counter() - start
+    peak_rss= resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb= peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+    return {'path': path, 'renders': renders, 'renders_per_second': renders / elapsed, 'peak_rss_mb': peak_rss_mb}
+
+def measure_in_child(path, renders, background=None):
+    environment= dict(os.environ)
+    if background:
+        environment['FIELD_BACKGROUND']= background
+    output= subprocess.run([sys.executable, '-m', 'benchmarks.bench_render', '--child', path, '--renders', str(renders)],
+                           env=environment, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser= argparse.ArgumentParser(description="Benchmark the field renderer")
+    parser.add_argument('--renders', type=int, default=20)
+    parser.add_argument('--webp', action='store_true', help="also measure the new renderer on static/cfb_field.webp")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args= parser.parse_args()
+    if args.child:
+        print(json.dumps(run_renderer(args.child, args.renders)))
+        return
+
+    runs= [('pyplot (old)', measure_in_child('pyplot', args.renders)),
+           ('figure/agg file', measure_in_child('file', args.renders)),
+           ('figure/agg buffer', measure_in_child('buffer', args.renders))]
+    if args.webp:
+        runs.append(('figure/agg webp bg', measure_in_child('file', args.renders, os.path.join('static', 'cfb_field.webp'))))
+    for label, result in runs:
+        print(f"{label:<20} {result['renders_per_second']:8.2f} renders/s   peak RSS {result['peak_rss_mb']:8.1f} MB")
+    print(f"speedup: {runs[1][1]['renders_per_second'] / runs[0][1]['renders_per_second']:.1f}x")
+
+if __name__ == '__main__':
+    main()
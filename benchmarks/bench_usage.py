@@ -0,0 +1,46 @@
+"""
+Overview: The following code compares the old way of finding the top 5 players by usage rate (a list comprehension over the whole season
+followed by a full sort) with the UsageIndex lookup. The scan and sort is copied here exactly as it was written in get_top5_usage_players
+so it can still be measured. The index is measured both with its one time build cost included and as a warm lookup, since in the app the
+index is built once per year and then reused by every request. Both paths are checked to return the same players before timing starts.
+Run it with python -m benchmarks.bench_usage.
+"""
+import argparse
+import timeit
+from usageindex import UsageIndex
+from benchmarks.fixtures import full_season_usage, team_names
+
+def scan_and_sort_top5(usage_data, team):
+    players_from_team= [player for player in usage_data if player.get('team') == team]
+    return sorted(players_from_team, key=lambda x: x.get('usage', {}).get('overall', 0.0), reverse=True)[:5]
+
+def report(label, seconds, lookups):
+    print(f"{label:<28} {seconds / lookups * 1e6:10.2f} us/lookup {lookups / seconds:12.0f} lookups/s")
+
+def main():
+    parser= argparse.ArgumentParser(description="Benchmark the top 5 usage lookup")
+    parser.add_argument('--teams', type=int, default=130)
+    parser.add_argument('--players-per-team', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=5)
+    args= parser.parse_args()
+
+    usage_data= full_season_usage(team_count=args.teams, players_per_team=args.players_per_team)
+    teams= team_names(args.teams)
+    usage_index= UsageIndex(usage_data)
+    for team in teams:
+        if [p['id'] for p in scan_and_sort_top5(usage_data, team)] != [p['id'] for p in usage_index.top_players(team)]:
+            raise SystemExit(f"Index and scan disagree for {team}")
+
+    print(f"{len(usage_data)} players on {len(teams)} teams, best of {args.repeat} runs")
+    scan= min(timeit.repeat(lambda: [scan_and_sort_top5(usage_data, team) for team in teams], number=1, repeat=args.repeat))
+    report("scan and sort", scan, len(teams))
+    build= min(timeit.repeat(lambda: UsageIndex(usage_data), number=1, repeat=args.repeat))
+    print(f"{'index build (once per year)':<28} {build * 1e3:10.2f} ms")
+    warm= min(timeit.repeat(lambda: [usage_index.top_players(team) for team in teams], number=1, repeat=args.repeat))
+    report("index top 5 overall", warm, len(teams))
+    split= min(timeit.repeat(lambda: [usage_index.top_players(team, n=10, split='thirdDown') for team in teams], number=1, repeat=args.repeat))
+    report("index top 10 thirdDown", split, len(teams))
+    print(f"speedup per warm lookup: {scan / warm:.1f}x")
+
+if __name__ == '__main__':
+    main()
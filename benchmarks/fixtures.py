@@ -0,0 +1,79 @@
+"""
+Overview: The following code makes synthetic CFBD payloads that are shaped like the real responses so the benchmarks can run without an api
+key. full_season_usage builds a player/usage payload for a whole season with the same size as the real one (about 130 FBS teams with
+around 60 players each that recorded a usage rate). A fixed seed is used so every run of a benchmark sees the same data.
+"""
+import random
+
+POSITIONS= ('QB', 'RB', 'RB', 'WR', 'WR', 'WR', 'TE', 'FB')
+CONFERENCES= ('SEC', 'Big Ten', 'ACC', 'Big 12', 'Pac-12', 'American Athletic', 'Mountain West', 'Sun Belt', 'Mid-American', 'Conference USA')
+
+def team_names(team_count=130):
+    return [f"Team {number:03d}" for number in range(team_count)]
+
+def full_season_usage(year=2023, team_count=130, players_per_team=60, seed=2023):
+    generator= random.Random(seed)
+    usage_data= []
+    player_id= 1
+    for team_number, team in enumerate(team_names(team_count)):
+        conference= CONFERENCES[team_number % len(CONFERENCES)]
+        for _ in range(players_per_team):
+            overall= round(generator.random() * 0.35, 4)
+            usage_data.append({
+                'season': int(year),
+                'id': str(player_id),
+                'name': f"Player {player_id}",
+                'position': generator.choice(POSITIONS),
+                'team': team,
+                'conference': conference,
+                'usage': {
+                    'overall': overall,
+                    'pass': round(overall * generator.random(), 4),
+                    'rush': round(overall * generator.random(), 4),
+                    'firstDown': round(generator.random() * 0.35, 4),
+                    'secondDown': round(generator.random() * 0.35, 4),
+                    'thirdDown': round(generator.random() * 0.35, 4),
+                    'standardDowns': round(generator.random() * 0.35, 4),
+                    'passingDowns': round(generator.random() * 0.35, 4),
+                },
+            })
+            player_id+= 1
+    return usage_data
+
+"""
+The following functions make the payloads for the ppa/players/season, stats/player/season and records endpoints. They are built from the usage
+payload so the player names line up across endpoints the same way they do in the real api. Like the real api, leaving out the team returns the
+whole league. Players only have stats in the categories their position plays (a QB passes and rushes, a WR or TE catches and so on).
+"""
+STAT_TYPES= {'passing': ('COMPLETIONS', 'ATT', 'YDS', 'TD', 'INT'), 'rushing': ('CAR', 'YDS', 'TD', 'LONG'), 'receiving': ('REC', 'YDS', 'TD', 'LONG')}
+POSITION_CATEGORIES= {'QB': ('passing', 'rushing'), 'RB': ('rushing', 'receiving'), 'FB': ('rushing', 'receiving'), 'WR': ('receiving',),
+                      'TE': ('receiving',)}
+
+def players_on(usage_data, team):
+    return [player for player in usage_data if team is None or player['team'] == team]
+
+def team_ppa(usage_data, team=None):
+    return [{'season': player['season'], 'id': player['id'], 'name': player['name'], 'position': player['position'], 'team': player['team'],
+             'conference': player['conference'], 'averagePPA': {'all': round(player['usage']['overall'] * 1.7, 4),
+                                                                'pass': round(player['usage']['pass'] * 1.9, 4),
+                                                                'rush': round(player['usage']['rush'] * 1.2, 4)}}
+            for player in players_on(usage_data, team)]
+
+def team_stats(usage_data, team=None, category=None):
+    return [{'season': player['season'], 'playerId': player['id'], 'player': player['name'], 'position': player['position'],
+             'team': player['team'], 'conference': player['conference'], 'category': stat_category, 'statType': stat_type,
+             'stat': str(int(player['usage']['overall'] * 1000) + index)}
+            for player in players_on(usage_data, team)
+            for stat_category in POSITION_CATEGORIES.get(player['position'], ()) if category is None or stat_category == category
+            for index, stat_type in enumerate(STAT_TYPES[stat_category])]
+
+def team_records(usage_data, team=None):
+    conferences= {}
+    for player in players_on(usage_data, team):
+        conferences.setdefault(player['team'], player['conference'])
+    records= []
+    for record_team, conference in conferences.items():
+        wins= sum(ord(character) for character in record_team) % 13
+        records.append({'year': usage_data[0]['season'], 'team': record_team, 'conference': conference, 'division': '',
+                        'total': {'games': 12, 'wins': wins, 'losses': 12 - wins, 'ties': 0}})
+    return records
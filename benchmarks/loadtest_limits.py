@@ -0,0 +1,98 @@
+"""
+Overview: The following code checks that the shared budget and the shared rate limit hold across several worker processes, the way they would
+under gunicorn. A stub CFBD server and a stub OpenAI server are started and every worker process imports app and obtaindata with the same
+LIMITS_PATH file. In the budget phase each worker keeps asking for new chatgpt summaries until the budget turns it away, and the money committed
+is compared with the limit and with the completions the stub actually served. In the rate phase each worker sends CFBD requests as fast as it can
+for a few seconds, and the requests the stub received are compared with what the token bucket allows (the burst plus rate times the elapsed time).
+Run it with python -m benchmarks.loadtest_limits.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from benchmarks.stub_server import StubCFBDServer
+from benchmarks.stub_openai import StubOpenAIServer
+
+def budget_worker(worker_number, start_together, results):
+    sys.stdout= open(os.devnull, 'w')
+    import app
+    start_together.wait()
+    completions= 0
+    while True:
+        chatgpt_response, cost_used= app.get_chatgpt_response(f"Team {worker_number}-{completions}", 2023, check_cache=False)
+        if chatgpt_response is None:
+            break
+        completions+= 1
+    results.put(completions)
+
+def rate_worker(worker_number, seconds, start_together, results):
+    sys.stdout= open(os.devnull, 'w')
+    import obtaindata
+    start_together.wait()
+    started= time.time()
+    stop_at= time.monotonic() + seconds
+    while time.monotonic() < stop_at:
+        obtaindata.fetch_from_the_api('records', {}, {'year': 2023, 'team': f"Team {worker_number:03d}"})
+    results.put((started, time.time()))
+
+"""
+run_workers starts the worker processes and holds them at a barrier until every one of them has finished importing, so the load starts at the same
+moment in every process. It returns what each worker put on the results queue.
+"""
+def run_workers(context, target, arguments, workers):
+    results= context.Queue()
+    start_together= context.Barrier(workers)
+    processes= [context.Process(target=target, args=(number, *arguments, start_together, results)) for number in range(workers)]
+    for process in processes:
+        process.start()
+    totals= [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return totals
+
+def main():
+    parser= argparse.ArgumentParser(description="Load test the shared budget and rate limiter")
+    parser.add_argument('--workers', type=int, default=6)
+    parser.add_argument('--budget', type=float, default=0.10, help="dollar limit shared by every worker")
+    parser.add_argument('--rate', type=float, default=20.0, help="CFBD requests per second shared by every worker")
+    parser.add_argument('--burst', type=float, default=5.0)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args= parser.parse_args()
+
+    cfbd_server= StubCFBDServer(delay=0.0).start()
+    openai_server= StubOpenAIServer(delay=0.02, summary_length=60).start()
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update({
+            'CFBD_API_URL': cfbd_server.url, 'CFBD_API_KEY': 'stub', 'OPENAI_API_KEY': 'stub', 'OPENAI_BASE_URL': openai_server.base_url,
+            'LIMITS_PATH': os.path.join(directory, 'limits.sqlite3'), 'CFBD_CACHE_PATH': os.path.join(directory, 'cfbd.sqlite3'),
+            'CHATGPT_CACHE_PATH': os.path.join(directory, 'summaries.sqlite3'), 'CHATGPT_BUDGET': str(args.budget),
+            'CFBD_RATE_LIMIT': str(args.rate), 'CFBD_RATE_BURST': str(args.burst),
+        })
+        from limits import SharedBudget
+        from app import chatgpt_cost
+        context= multiprocessing.get_context('spawn')
+
+        completions= run_workers(context, budget_worker, (), args.workers)
+        spent= SharedBudget('openai', args.budget).spent()
+        cost_per_completion= chatgpt_cost(30, 60)
+        print(f"budget: {args.workers} workers, limit ${args.budget:.4f}, committed ${spent:.4f}, "
+              f"completions {sum(completions)} (stub served {openai_server.completions})")
+        budget_holds= spent <= args.budget + 1e-9 and abs(spent - openai_server.completions * cost_per_completion) < 1e-9
+        print(f"budget holds: {budget_holds}")
+
+        cfbd_server.reset_counts()
+        windows= run_workers(context, rate_worker, (args.seconds,), args.workers)
+        elapsed= max(stopped for _, stopped in windows) - min(started for started, _ in windows)
+        allowed= args.burst + args.rate * elapsed
+        received= cfbd_server.counts['requests']
+        print(f"rate: {args.workers} workers, {received} CFBD requests in {elapsed:.2f} s (allowed {allowed:.0f}, "
+              f"{received / elapsed:.1f}/s against a limit of {args.rate:.1f}/s)")
+        print(f"rate holds: {received <= allowed}")
+    cfbd_server.stop()
+    openai_server.stop()
+    return 0 if budget_holds and received <= allowed else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
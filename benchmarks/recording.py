@@ -0,0 +1,104 @@
+"""
+Overview: The following code records the CFBD responses the app asks for and replays them from a local server, so the benchmarks can run against
+real data without an api key or network access and give the same answers every time. Recording runs the same code the app runs (get_usage_index,
+fetch_team_data for every team and the league-wide comparison requests) with fetch_from_the_api wrapped so every payload that comes back is stored
+under its response cache key. The recording is one gzipped JSON file. ReplayCFBDServer is the stub server answering from a recording instead of
+the synthetic fixtures, and anything that wasn't recorded gets a 404 like an unknown endpoint would.
+
+Record the real api with CFBD_API_KEY set:
+    python -m benchmarks.recording --year 2023 --conference SEC --output benchmarks/recordings/sec-2023.json.gz
+or record the synthetic stub server (no api key needed):
+    python -m benchmarks.recording --synthetic --year 2023 --output benchmarks/recordings/synthetic-2023.json.gz
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from apicache import make_cache_key
+from benchmarks.stub_server import StubCFBDServer
+
+def record_responses(year, teams=None, conference=None):
+    import obtaindata
+    import compare
+    responses= {}
+    responses_lock= threading.Lock()
+    fetch= obtaindata.fetch_from_the_api
+    response_cache= obtaindata.response_cache
+
+    def recording_fetch(endpoint, headers, params):
+        payload= fetch(endpoint, headers, params)
+        if payload is not None:
+            with responses_lock:
+                responses[make_cache_key(endpoint, params)]= payload
+        return payload
+
+    obtaindata.fetch_from_the_api= recording_fetch
+    obtaindata.response_cache= obtaindata.ResponseCache(db_path=None, max_entries=100000)
+    try:
+        headers= obtaindata.cfbd_headers()
+        if headers is None:
+            return None
+        usage_index= obtaindata.get_usage_index(headers, year)
+        if usage_index is None:
+            print(f"Unable to retrieve usage data for {year}")
+            return None
+        teams= teams or usage_index.teams(conference)
+        for team in teams:
+            obtaindata.fetch_team_data(headers, year, team)
+        compare.get_season_tables(headers, year)
+    finally:
+        obtaindata.fetch_from_the_api= fetch
+        obtaindata.response_cache= response_cache
+    return {'year': year, 'teams': list(teams), 'api_url': obtaindata.api_url, 'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'responses': responses}
+
+def save_recording(path, recording):
+    directory= os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with gzip.open(path, 'wt', encoding='utf-8') as recording_file:
+        json.dump(recording, recording_file, separators=(',', ':'))
+
+def load_recording(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as recording_file:
+        return json.load(recording_file)
+
+class ReplayCFBDServer(StubCFBDServer):
+    def __init__(self, recording, delay=0.05, port=0):
+        super().__init__(delay=delay, usage_data=[], port=port)
+        self.recording= recording
+
+    def payload_for(self, endpoint, params):
+        return self.recording['responses'].get(make_cache_key(endpoint, params))
+
+def main():
+    parser= argparse.ArgumentParser(description="Record CFBD responses for the benchmarks")
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--conference', help="only record the teams of one conference")
+    parser.add_argument('--teams', help="comma separated list of teams to record instead of a conference")
+    parser.add_argument('--synthetic', action='store_true', help="record the synthetic stub server instead of the real api")
+    parser.add_argument('--output', required=True)
+    args= parser.parse_args()
+
+    os.environ.setdefault('FIELD_BACKGROUND', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'football.jpg'))
+    server= None
+    if args.synthetic:
+        server= StubCFBDServer(delay=0).start()
+        os.environ['CFBD_API_URL']= server.url
+        os.environ['CFBD_API_KEY']= 'synthetic'
+    teams= [team.strip() for team in args.teams.split(',') if team.strip()] if args.teams else None
+    try:
+        recording= record_responses(args.year, teams=teams, conference=args.conference)
+    finally:
+        if server is not None:
+            server.stop()
+    if recording is None:
+        return 1
+    save_recording(args.output, recording)
+    print(f"Recorded {len(recording['responses'])} responses for {len(recording['teams'])} teams to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
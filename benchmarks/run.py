@@ -0,0 +1,354 @@
+"""
+Overview: The following code is the benchmark suite. It runs the whole app offline against local servers: CFBD responses are replayed from a
+recording (see recording.py) or come from the synthetic stub server, and chatgpt summaries come from the fake chat completions server in
+stub_openai.py. Every cache (responses, summaries, renders, limits) lives in a temporary directory so the machine's own caches are never touched.
+
+The suite measures:
+    micro benchmarks of get_top5_usage_players, concurrent_assigning_of_player_data, generate_stats_info and victoryformation (warm caches, so
+    they measure the work done in this process rather than the stub latency),
+    the latency of one home() POST through the flask test client with every cache cleared (cold) and with everything cached (warm),
+    the throughput and latency of home() POSTs sent by several threads at once to a real threaded server, cold and warm.
+Every benchmark also records its peak Python memory with tracemalloc. tracemalloc slows code down, so the peak comes from one extra run that is
+not part of the timings. The results are saved as JSON with the commit they were measured on, so two runs can be compared:
+    python -m benchmarks.run
+    python -m benchmarks.run --recording benchmarks/recordings/sec-2023.json.gz --output before.json
+    python -m benchmarks.run --compare before.json after.json
+The comparison prints the change of every benchmark and exits with 1 when one got slower (or used more memory) by more than the threshold.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmarks.stub_server import StubCFBDServer
+from benchmarks.stub_openai import StubOpenAIServer
+from benchmarks.recording import load_recording, ReplayCFBDServer
+
+repository_folder= os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ERROR_MESSAGES= (b"Unable to retrieve data", b"Unable to get a response", b"Budget limit exceeded")
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+def git_output(*arguments):
+    try:
+        return subprocess.run(['git', *arguments], cwd=repository_folder, capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def percentile(values, fraction):
+    ordered= sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def max_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+"""
+peak_memory runs a function once with tracemalloc on and returns the most memory Python had allocated at one time during the call, counted from
+the start of the call.
+"""
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline= tracemalloc.get_traced_memory()[0]
+        function()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+"""
+measure times body the way timeit does: the number of calls per run is raised until a run takes at least min_seconds, then repeat runs are timed
+and the seconds per call of each run are kept. setup is called before every run (and before the memory run) without being timed.
+"""
+def measure(body, setup=None, repeat=7, warmup=1, min_seconds=0.05, calibrate=True):
+    setup= setup or (lambda: None)
+    for _ in range(warmup):
+        setup()
+        body()
+    number= 1
+    while calibrate:
+        setup()
+        start= time.perf_counter()
+        for _ in range(number):
+            body()
+        if time.perf_counter() - start >= min_seconds or number >= 1_000_000:
+            break
+        number*= 10
+    timings= []
+    for _ in range(repeat):
+        setup()
+        start= time.perf_counter()
+        for _ in range(number):
+            body()
+        timings.append((time.perf_counter() - start) / number)
+    setup()
+    return {'runs': repeat, 'number': number, 'min': min(timings), 'median': statistics.median(timings), 'mean': statistics.fmean(timings),
+            'p95': percentile(timings, 0.95), 'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0, 'peak_memory_bytes': peak_memory(body)}
+
+"""
+The Environment class starts the stub servers, points the app at them through its env variables and then imports app and obtaindata (they read
+the env variables when they are imported). clear_caches empties every cache the home route goes through, which is what a cold request sees.
+"""
+class Environment:
+    def __init__(self, recording_path=None, cfbd_delay=0.02, openai_delay=0.25, summary_length=120):
+        self.temporary_folder= tempfile.TemporaryDirectory(prefix='cfb-bench-')
+        if recording_path:
+            self.recording= load_recording(recording_path)
+            with open(recording_path, 'rb') as recording_file:
+                self.fixtures= {'source': 'recording', 'path': recording_path, 'sha256': hashlib.sha256(recording_file.read()).hexdigest()}
+            self.cfbd= ReplayCFBDServer(self.recording, delay=cfbd_delay).start()
+        else:
+            self.recording= None
+            self.fixtures= {'source': 'synthetic'}
+            self.cfbd= StubCFBDServer(delay=cfbd_delay).start()
+        self.openai= StubOpenAIServer(delay=openai_delay, summary_length=summary_length).start()
+        folder= self.temporary_folder.name
+        os.environ.update({'CFBD_API_URL': self.cfbd.url, 'CFBD_API_KEY': 'benchmark', 'OPENAI_API_KEY': 'benchmark',
+                           'OPENAI_BASE_URL': self.openai.base_url, 'CFBD_CACHE_PATH': os.path.join(folder, 'cfbd_cache.sqlite3'),
+                           'CFBD_CACHE_MAX_ENTRIES': '4096', 'CHATGPT_CACHE_PATH': os.path.join(folder, 'chatgpt_summaries.sqlite3'),
+                           'LIMITS_PATH': os.path.join(folder, 'limits.sqlite3'), 'FIELD_RENDER_DIR': os.path.join(folder, 'renders'),
+                           'FIELD_BACKGROUND': os.path.join(repository_folder, 'static', 'football.jpg'), 'CHATGPT_BUDGET': '1000000',
+                           'CHATGPT_STREAMING': '0', 'CFBD_RATE_LIMIT': '0', 'OPENAI_RATE_LIMIT': '0'})
+        import app
+        import obtaindata
+        self.app= app
+        self.obtaindata= obtaindata
+        self.headers= obtaindata.cfbd_headers()
+
+    def teams(self, year):
+        if self.recording is not None:
+            return list(self.recording['teams'])
+        return self.obtaindata.get_usage_index(self.headers, year).teams()
+
+    def clear_caches(self):
+        self.obtaindata.response_cache.clear()
+        self.obtaindata.usage_indexes.clear()
+        self.obtaindata.render_cache.clear()
+        self.app.summary_cache.clear()
+
+    def close(self):
+        self.cfbd.stop()
+        self.openai.stop()
+        self.temporary_folder.cleanup()
+
+def check_home_response(response_status, body):
+    if response_status != 200 or any(message in body for message in ERROR_MESSAGES):
+        raise RuntimeError(f"home() failed with status {response_status}: {body[:200]!r}")
+
+"""
+The micro benchmarks use the data of one team. Its responses are fetched once beforehand so the usage index and the response cache are warm.
+concurrent_assigning_of_player_data updates the player dictionaries, so it is handed fresh copies on every call.
+"""
+def micro_benchmarks(environment, year, team, repeat):
+    obtaindata= environment.obtaindata
+    headers= environment.headers
+    sorted_players, team_info= obtaindata.fetch_team_data(headers, year, team)
+    if not sorted_players:
+        raise RuntimeError(f"No data for {team} in {year}")
+    top5= obtaindata.get_top5_usage_players(headers, year, team)
+    categories= [obtaindata.obtain_playerST_category(player.get('position')) for player in sorted_players]
+
+    def stats_info():
+        for player, player_category in zip(sorted_players, categories):
+            obtaindata.generate_stats_info(player, player_category)
+
+    return {
+        'get_top5_usage_players': measure(lambda: obtaindata.get_top5_usage_players(headers, year, team), repeat=repeat),
+        'concurrent_assigning_of_player_data': measure(lambda: obtaindata.concurrent_assigning_of_player_data(
+            headers, year, team, [dict(player) for player in top5]), repeat=repeat),
+        'generate_stats_info': measure(stats_info, repeat=repeat),
+        'victoryformation': measure(lambda: obtaindata.victoryformation(sorted_players, team_info, output_path=None), repeat=repeat),
+    }
+
+"""
+The latency benchmarks POST the home form through flask's test client, so they include the template rendering but not a network hop. The cold
+run clears every cache before each request: the usage, ppa, stats and records requests, the field render and the chatgpt summary all happen again.
+"""
+def latency_benchmarks(environment, year, team, repeat):
+    client= environment.app.app.test_client()
+
+    def post_home():
+        response= client.post('/', data={'team': team, 'year': str(year)})
+        check_home_response(response.status_code, response.data)
+
+    return {
+        'home_post_cold': measure(post_home, setup=environment.clear_caches, repeat=repeat, warmup=1, calibrate=False),
+        'home_post_warm': measure(post_home, repeat=repeat, warmup=1),
+    }
+
+"""
+run_load serves the app from a threaded werkzeug server and sends one POST per team from concurrency threads at once, each with its own
+requests.Session. It reports the throughput, the latency percentiles, the errors and how many upstream requests the stubs received.
+"""
+def run_load(environment, base_url, year, teams, concurrency):
+    local= threading.local()
+
+    def post_home(team):
+        if not hasattr(local, 'session'):
+            local.session= requests.Session()
+        start= time.perf_counter()
+        try:
+            response= local.session.post(base_url, data={'team': team, 'year': str(year)}, timeout=120)
+            check_home_response(response.status_code, response.content)
+            return time.perf_counter() - start, None
+        except (requests.RequestException, RuntimeError) as e:
+            return time.perf_counter() - start, str(e)
+
+    environment.cfbd.reset_counts()
+    completions_before= environment.openai.completions
+    start= time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes= list(executor.map(post_home, teams))
+    elapsed= time.perf_counter() - start
+    latencies= [latency for latency, _ in outcomes]
+    errors= [error for _, error in outcomes if error]
+    return {'requests': len(teams), 'concurrency': concurrency, 'seconds': elapsed, 'throughput': len(teams) / elapsed,
+            'errors': len(errors), 'first_error': errors[0] if errors else None,
+            'latency': {'median': statistics.median(latencies), 'p95': percentile(latencies, 0.95), 'max': max(latencies)},
+            'cfbd_requests': environment.cfbd.counts['requests'], 'openai_completions': environment.openai.completions - completions_before}
+
+def load_benchmarks(environment, year, teams, concurrency, request_count):
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server= make_server('127.0.0.1', 0, environment.app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url= f"http://127.0.0.1:{server.server_port}/"
+    load_teams= [teams[index % len(teams)] for index in range(request_count)]
+    try:
+        environment.clear_caches()
+        cold= run_load(environment, base_url, year, load_teams, concurrency)
+        warm= run_load(environment, base_url, year, load_teams, concurrency)
+        environment.clear_caches()
+        cold['peak_memory_bytes']= peak_memory(lambda: run_load(environment, base_url, year, load_teams, concurrency))
+        warm['peak_memory_bytes']= peak_memory(lambda: run_load(environment, base_url, year, load_teams, concurrency))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {'home_post_load_cold': cold, 'home_post_load_warm': warm}
+
+def run_suite(args):
+    log(f"Starting stub servers ({'recording ' + args.recording if args.recording else 'synthetic fixtures'})")
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        environment= Environment(args.recording, args.cfbd_delay, args.openai_delay)
+        try:
+            teams= environment.teams(args.year)
+            team= args.team or teams[0]
+            benchmarks= {}
+            log(f"Micro benchmarks ({team})")
+            benchmarks.update(micro_benchmarks(environment, args.year, team, args.repeat))
+            log("home() latency")
+            benchmarks.update(latency_benchmarks(environment, args.year, team, args.repeat))
+            if args.requests:
+                log(f"home() under load ({args.requests} requests, {args.concurrency} at a time)")
+                benchmarks.update(load_benchmarks(environment, args.year, teams, args.concurrency, args.requests))
+            fixtures= environment.fixtures
+        finally:
+            environment.close()
+    import numpy
+    import matplotlib
+    return {'commit': git_output('rev-parse', 'HEAD'), 'dirty': bool(git_output('status', '--porcelain', '--untracked-files=no')),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'numpy': numpy.__version__, 'matplotlib': matplotlib.__version__},
+            'settings': {'year': args.year, 'team': team, 'repeat': args.repeat, 'cfbd_delay': args.cfbd_delay, 'openai_delay': args.openai_delay,
+                         'concurrency': args.concurrency, 'requests': args.requests},
+            'fixtures': fixtures, 'max_rss_bytes': max_rss_bytes(), 'benchmarks': benchmarks}
+
+"""
+Each benchmark is compared on one headline number: the median seconds per call for the micro and latency benchmarks and the throughput for the
+load benchmarks (where higher is better), plus the peak memory of each.
+"""
+def headline(result):
+    if 'throughput' in result:
+        return 'throughput', result['throughput'], True
+    return 'median', result['median'], False
+
+def compare_results(old, new, threshold):
+    regressions= []
+    print(f"{'benchmark':<38} {'metric':<11} {'old':>12} {'new':>12} {'change':>8}")
+    for name, new_result in new['benchmarks'].items():
+        old_result= old['benchmarks'].get(name)
+        if old_result is None:
+            print(f"{name:<38} (new)")
+            continue
+        metric, new_value, higher_is_better= headline(new_result)
+        old_value= headline(old_result)[1]
+        checks= [(metric, old_value, new_value, higher_is_better)]
+        if old_result.get('peak_memory_bytes') and new_result.get('peak_memory_bytes'):
+            checks.append(('peak_mem', old_result['peak_memory_bytes'], new_result['peak_memory_bytes'], False))
+        for check_metric, old_value, new_value, higher_is_better in checks:
+            change= (new_value - old_value) / old_value if old_value else 0.0
+            worse= -change if higher_is_better else change
+            flag= '  REGRESSION' if worse > threshold else ''
+            if flag:
+                regressions.append((name, check_metric))
+            print(f"{name:<38} {check_metric:<11} {old_value:>12.6g} {new_value:>12.6g} {change * 100:>+7.1f}%{flag}")
+    print(f"old: {old.get('commit')} ({old.get('created_at')})   new: {new.get('commit')} ({new.get('created_at')})")
+    return regressions
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+def default_output_path(results):
+    name= f"{time.strftime('%Y%m%d-%H%M%S')}-{(results.get('commit') or 'unknown')[:10]}.json"
+    return os.path.join(repository_folder, 'benchmarks', 'results', name)
+
+def main(arguments=None):
+    parser= argparse.ArgumentParser(description="Run the offline benchmark suite and save the results as JSON")
+    parser.add_argument('--recording', help="gzipped CFBD recording to replay (the synthetic stub server is used when left out)")
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--team', help="team for the micro and latency benchmarks (the first team when left out)")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--cfbd-delay', type=float, default=0.02, help="seconds the CFBD stub waits before each response")
+    parser.add_argument('--openai-delay', type=float, default=0.25, help="seconds the chat completions stub takes per completion")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=64, help="home() POSTs per load run (0 skips the load benchmarks)")
+    parser.add_argument('--output', help="where to save the results (benchmarks/results/<time>-<commit>.json by default)")
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS', help="compare two results files, or one with a new run")
+    parser.add_argument('--threshold', type=float, default=0.15, help="relative change counted as a regression when comparing")
+    args= parser.parse_args(arguments)
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two results files")
+    if args.compare and len(args.compare) == 2:
+        old, new= (load_results(path) for path in args.compare)
+    else:
+        new= run_suite(args)
+        output_path= args.output or default_output_path(new)
+        directory= os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output_path, 'w') as output_file:
+            json.dump(new, output_file, indent=2)
+        log(f"Saved results to {output_path}")
+        if not args.compare:
+            for name, result in new['benchmarks'].items():
+                if 'throughput' in result:
+                    print(f"{name:<38} {result['throughput']:8.1f} req/s   p95 {result['latency']['p95'] * 1e3:8.1f} ms   "
+                          f"errors {result['errors']}   peak {result['peak_memory_bytes'] / 1024:9.1f} KiB")
+                else:
+                    print(f"{name:<38} median {result['median'] * 1e3:10.3f} ms   p95 {result['p95'] * 1e3:10.3f} ms   "
+                          f"peak {result['peak_memory_bytes'] / 1024:9.1f} KiB")
+            return 0
+        old= load_results(args.compare[0])
+    return 1 if compare_results(old, new, args.threshold) else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+"""
+Overview: The following code runs a local fake of the OpenAI chat completions endpoint so the chatgpt summary can be exercised without an api key
+or spending money. Pointing the client at it only needs the OPENAI_BASE_URL env variable (for example http://127.0.0.1:8001/v1). It answers
+POST /v1/chat/completions with a made up summary, either as one JSON completion or, when stream is true, as server-sent event chunks followed by
+a usage chunk and [DONE]. The delay is spread over the chunks so a streamed summary takes as long as a blocking one. Every completion is counted
+so a benchmark can show how many were paid for. The first rate_limited requests are answered with a 429 error so retries can be tested, and when
+fail_after is set a streamed completion sends an error chunk after that many words, like a stream that breaks half way.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version= 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body= json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self.send_json(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+            return
+        if self.server.take_rate_limited():
+            self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}})
+            return
+        self.server.count()
+        prompt= body['messages'][-1]['content']
+        words= self.server.summary_words(prompt)
+        usage= {'prompt_tokens': 30, 'completion_tokens': len(words), 'total_tokens': 30 + len(words)}
+        if body.get('stream'):
+            self.stream_completion(body, words, usage)
+        else:
+            time.sleep(self.server.delay)
+            self.send_json(200, {'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': body.get('model'),
+                                 'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': ' '.join(words)}}],
+                                 'usage': usage})
+
+    def send_json(self, status, payload):
+        data= json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream_completion(self, body, words, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        base= {'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': body.get('model')}
+        for index, word in enumerate(words):
+            if index == self.server.fail_after:
+                self.wfile.write(f"data: {json.dumps({'error': {'message': 'stream broke', 'type': 'server_error'}})}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                self.close_connection= True
+                return
+            time.sleep(self.server.delay / len(words))
+            chunk= dict(base, choices=[{'index': 0, 'delta': {'content': word if index == 0 else ' ' + word}, 'finish_reason': None}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(f"data: {json.dumps(dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))}\n\n".encode('utf-8'))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            self.wfile.write(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection= True
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    daemon_threads= True
+
+    def __init__(self, delay=0.5, summary_length=120, port=0, rate_limited=0, fail_after=None):
+        super().__init__(('127.0.0.1', port), StubOpenAIHandler)
+        self.delay= delay
+        self.summary_length= summary_length
+        self.rate_limited= rate_limited
+        self.fail_after= fail_after
+        self.completions= 0
+        self.completions_lock= threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def take_rate_limited(self):
+        with self.completions_lock:
+            if self.rate_limited > 0:
+                self.rate_limited-= 1
+                return True
+            return False
+
+    def count(self):
+        with self.completions_lock:
+            self.completions+= 1
+
+    def summary_words(self, prompt):
+        words= f"Summary of {prompt}".split()
+        return (words * (self.summary_length // len(words) + 1))[:self.summary_length]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
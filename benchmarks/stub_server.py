@@ -0,0 +1,86 @@
+"""
+Overview: The following code runs a local stand in for the CFBD api so the data layer can be measured without an api key or network access.
+The StubCFBDServer answers the player/usage, ppa/players/season, stats/player/season and records endpoints from the synthetic payloads in
+fixtures.py and sleeps for a fixed delay before each response to act like the round trip to the real api. It speaks HTTP/1.1 so clients can
+keep connections alive, and it counts the requests and new connections it receives so a benchmark can show how many were made.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from benchmarks.fixtures import full_season_usage, team_ppa, team_stats, team_records
+
+class StubCFBDHandler(BaseHTTPRequestHandler):
+    protocol_version= 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.count('requests')
+        url= urlparse(self.path)
+        params= {name: values[0] for name, values in parse_qs(url.query).items()}
+        payload= self.server.payload_for(url.path.strip('/'), params)
+        time.sleep(self.server.delay)
+        if payload is None:
+            body= b'{"error": "not found"}'
+            self.send_response(404)
+        else:
+            body= json.dumps(payload).encode('utf-8')
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class StubCFBDServer(ThreadingHTTPServer):
+    daemon_threads= True
+
+    def __init__(self, delay=0.05, usage_data=None, port=0):
+        super().__init__(('127.0.0.1', port), StubCFBDHandler)
+        self.delay= delay
+        self.usage_data= usage_data if usage_data is not None else full_season_usage()
+        self.counts= {'requests': 0, 'connections': 0}
+        self.counts_lock= threading.Lock()
+        self.thread= None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def count(self, name):
+        with self.counts_lock:
+            self.counts[name]+= 1
+
+    def reset_counts(self):
+        with self.counts_lock:
+            self.counts= {name: 0 for name in self.counts}
+
+    def payload_for(self, endpoint, params):
+        team= params.get('team')
+        if endpoint == 'player/usage':
+            return self.usage_data
+        if endpoint == 'ppa/players/season':
+            players= team_ppa(self.usage_data, team)
+            if 'player' in params:
+                players= [player for player in players if player['name'] == params['player']]
+            return players
+        if endpoint == 'stats/player/season':
+            return team_stats(self.usage_data, team, params.get('category'))
+        if endpoint == 'records':
+            return team_records(self.usage_data, team)
+        return None
+
+    def start(self):
+        self.thread= threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
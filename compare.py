@@ -0,0 +1,180 @@
+"""
+Overview: The following code answers comparisons across many team-seasons at once for the /api/compare route. Instead of the per team requests
+get_team_data makes, every season is requested league-wide: one player/usage payload, one ppa/players/season payload, one stats/player/season
+payload per stat category and one records payload. The payloads are turned into NumPy columns once per year (SeasonTables) and the ranking,
+the ppa and YDS/TD lookups and the per stat category breakdowns are done with array operations over the whole season instead of loops over players,
+so sweeping every team in a conference or the whole league costs about the same as looking up one team.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import numpy as np
+import obtaindata
+from metrics import span, submit_in_context
+from usageindex import SPLIT_ALIASES
+
+FETCHED_CATEGORIES= ('passing', 'rushing', 'receiving')
+STAT_CATEGORIES= FETCHED_CATEGORIES + ('unknown',)
+KEY_SEPARATOR= '\x1f'
+
+"""
+stat_categories is obtain_playerST_category for a whole column of positions at once. It only calls obtain_playerST_category once per distinct position
+and spreads the answers back over the column with the inverse from np.unique, so the position to category mapping lives in one place. join_keys glues columns of strings together into one key per row
+so rows from different payloads can be matched, and lookup finds each query key in a sorted key column with searchsorted, returning default where
+a key isn't there.
+"""
+def stat_categories(positions):
+    distinct_positions, inverse= np.unique(np.asarray(positions, dtype=str), return_inverse=True)
+    categories= np.array([obtaindata.obtain_playerST_category(position) for position in distinct_positions], dtype=str)
+    return categories[inverse]
+
+def join_keys(*columns):
+    keys= np.asarray(columns[0], dtype=str)
+    for column in columns[1:]:
+        keys= np.char.add(np.char.add(keys, KEY_SEPARATOR), np.asarray(column, dtype=str))
+    return keys
+
+def lookup(sorted_keys, values, query_keys, default=0.0):
+    if len(sorted_keys) == 0 or len(query_keys) == 0:
+        return np.full(len(query_keys), default, dtype=np.float64)
+    positions= np.minimum(np.searchsorted(sorted_keys, query_keys), len(sorted_keys) - 1)
+    found= sorted_keys[positions] == query_keys
+    return np.where(found, values[positions], default)
+
+def string_column(rows, field):
+    return np.array([str(row.get(field)) for row in rows], dtype=str)
+
+"""
+The SeasonTables class holds the columns of one season. The ppa payload becomes a sorted (team, name) key column with the averagePPA of each key. The
+stats payloads are filtered down to the YDS and TD rows with a mask, and the YDS and TD of every (team, player, category) are added up with np.add.at
+into two columns next to a sorted key column. The records are kept by team since there is only one per team.
+"""
+class SeasonTables:
+    def __init__(self, usage_index, ppa_data, stats_data, records_data):
+        self.usage_index= usage_index
+        ppa_keys= join_keys(string_column(ppa_data, 'team'), string_column(ppa_data, 'name'))
+        ppa_values= np.array([float(((row.get('averagePPA') or {}).get('all')) or 0.0) for row in ppa_data], dtype=np.float64)
+        ppa_order= np.argsort(ppa_keys, kind='stable')
+        self.ppa_keys= ppa_keys[ppa_order]
+        self.ppa_values= ppa_values[ppa_order]
+
+        stat_types= string_column(stats_data, 'statType')
+        is_yds= stat_types == 'YDS'
+        is_td= stat_types == 'TD'
+        keep= is_yds | is_td
+        kept_rows= [row for row, kept in zip(stats_data, keep) if kept]
+        stat_values= np.array([float(row.get('stat') or 0) for row in kept_rows], dtype=np.float64)
+        stat_keys= join_keys(string_column(kept_rows, 'team'), string_column(kept_rows, 'player'), string_column(kept_rows, 'category'))
+        self.stat_keys, inverse= np.unique(stat_keys, return_inverse=True)
+        self.yds= np.zeros(len(self.stat_keys))
+        self.td= np.zeros(len(self.stat_keys))
+        np.add.at(self.yds, inverse[is_yds[keep]], stat_values[is_yds[keep]])
+        np.add.at(self.td, inverse[is_td[keep]], stat_values[is_td[keep]])
+
+        self.records= {record.get('team'): record for record in records_data}
+
+"""
+get_season_tables requests the league-wide payloads of a year at the same time (each one goes through the response cache) and builds the
+SeasonTables. Like the usage index, the tables of a year are kept and only rebuilt when the cache hands back different payloads. None is returned
+if the usage payload couldn't be retrieved. The other payloads are treated as empty when they fail so the comparison still returns usage rates.
+A failed payload is always the same EMPTY_PAYLOAD list, so a year whose payload keeps failing isn't rebuilt on every call.
+"""
+EMPTY_PAYLOAD= []
+season_tables= {}
+season_tables_lock= threading.Lock()
+
+def get_season_tables(headers, year):
+    planned_requests= [('ppa', 'ppa/players/season', {'year': year})]
+    planned_requests+= [(category, 'stats/player/season', {'year': year, 'category': category}) for category in FETCHED_CATEGORIES]
+    planned_requests.append(('records', 'records', {'year': year}))
+
+    def fetch_planned(key, endpoint, params):
+        with span(f"compare_{'stats' if key in FETCHED_CATEGORIES else key}"):
+            return obtaindata.request_the_api(endpoint, headers=headers, params=params) or EMPTY_PAYLOAD
+
+    with ThreadPoolExecutor(max_workers=len(planned_requests)) as executor:
+        futures= {key: submit_in_context(executor, fetch_planned, key, endpoint, params) for key, endpoint, params in planned_requests}
+        usage_index= obtaindata.get_usage_index(headers, year)
+        responses= {key: future.result() for key, future in futures.items()}
+    if usage_index is None:
+        return None
+    stats_data= [row for category in FETCHED_CATEGORIES for row in responses[category]]
+    payloads= (usage_index, responses['ppa'], *(responses[category] for category in FETCHED_CATEGORIES), responses['records'])
+    year_key= str(year).strip()
+    with season_tables_lock:
+        cached= season_tables.get(year_key)
+        if cached is None or any(old is not new for old, new in zip(cached[0], payloads)):
+            cached= (payloads, SeasonTables(usage_index, responses['ppa'], stats_data, responses['records']))
+            season_tables[year_key]= cached
+    return cached[1]
+
+"""
+compare_season ranks the top n players by the usage split for every requested team of one season in a single pass: top_rows returns all of the rows at
+once, the stat category comes from stat_categories and the averagePPA, YDS and TD are found with lookup. The per stat category breakdown adds up the
+players, usage, averagePPA, YDS and TD of each (team, category) pair with np.bincount. Only the final step of turning the columns into a list of
+dictionaries for the JSON response goes team by team.
+"""
+def compare_season(tables, year, teams, n=5, split='overall'):
+    usage_index= tables.usage_index
+    team_positions, rows= usage_index.top_rows(teams, n=n, split=split)
+    team_array= np.asarray(teams, dtype=str)
+    player_teams= team_array[team_positions] if len(teams) else np.array([], dtype=str)
+    names= usage_index.names[rows]
+    positions= usage_index.positions[rows]
+    categories= stat_categories(positions)
+    usage_values= usage_index.usage[SPLIT_ALIASES.get(split, split)][rows]
+    ppa_values= lookup(tables.ppa_keys, tables.ppa_values, join_keys(player_teams, names)) if len(rows) else np.zeros(0)
+    stat_keys= join_keys(player_teams, names, categories) if len(rows) else np.array([], dtype=str)
+    yds= lookup(tables.stat_keys, tables.yds, stat_keys)
+    td= lookup(tables.stat_keys, tables.td, stat_keys)
+
+    category_codes= np.searchsorted(np.array(sorted(STAT_CATEGORIES)), categories)
+    groups= team_positions * len(STAT_CATEGORIES) + category_codes
+    group_count= len(teams) * len(STAT_CATEGORIES)
+    breakdown= {
+        'players': np.bincount(groups, minlength=group_count),
+        'usage': np.bincount(groups, weights=usage_values, minlength=group_count),
+        'averagePPA': np.bincount(groups, weights=ppa_values, minlength=group_count),
+        'YDS': np.bincount(groups, weights=yds, minlength=group_count),
+        'TD': np.bincount(groups, weights=td, minlength=group_count),
+    }
+    team_starts= np.searchsorted(team_positions, np.arange(len(teams) + 1))
+
+    results= []
+    for team_position, team in enumerate(teams):
+        start, stop= team_starts[team_position], team_starts[team_position + 1]
+        if start == stop:
+            continue
+        players= [{'name': str(names[row]), 'position': str(positions[row]), 'category': str(categories[row]), 'usage': float(usage_values[row]),
+                   'averagePPA': float(ppa_values[row]), 'YDS': float(yds[row]), 'TD': float(td[row])} for row in range(start, stop)]
+        by_category= {}
+        for category_code, category in enumerate(sorted(STAT_CATEGORIES)):
+            group= team_position * len(STAT_CATEGORIES) + category_code
+            count= int(breakdown['players'][group])
+            if count:
+                by_category[category]= {'players': count, 'usage': float(breakdown['usage'][group]),
+                                        'averagePPA': float(breakdown['averagePPA'][group] / count),
+                                        'YDS': float(breakdown['YDS'][group]), 'TD': float(breakdown['TD'][group])}
+        record= tables.records.get(team, {})
+        results.append({'team': team, 'year': int(year), 'conference': usage_index.team_conferences.get(team),
+                        'record': record.get('total'), 'players': players, 'categories': by_category})
+    return results
+
+"""
+compare_team_seasons runs compare_season for every year. teams can be given directly or chosen by conference (or every team when neither is given),
+in which case the team list of each year comes from that year's usage payload. Team-seasons without any players are listed under missing.
+"""
+def compare_team_seasons(headers, years, teams=None, conference=None, n=5, split='overall'):
+    results= []
+    missing= []
+    for year in years:
+        tables= get_season_tables(headers, year)
+        if tables is None:
+            missing.extend({'team': team, 'year': int(year)} for team in (teams or []))
+            continue
+        year_teams= teams or tables.usage_index.teams(conference)
+        with span('compare_rank'):
+            season_results= compare_season(tables, year, year_teams, n=n, split=split)
+        found= {result['team'] for result in season_results}
+        missing.extend({'team': team, 'year': int(year)} for team in year_teams if team not in found)
+        results.extend(season_results)
+    return {'results': results, 'missing': missing}
@@ -0,0 +1,166 @@
+"""
+Overview: The following code limits how fast requests are sent to an upstream api and how much money can be spent on them, across every worker
+process at once. Under gunicorn every worker is its own process, so a limit kept in memory would let each worker send its own share of requests.
+Instead the state is kept in a SQLite file that every worker process opens, using WAL mode so reads don't block each other. Each change happens
+inside a BEGIN IMMEDIATE transaction, which takes SQLite's write lock before anything is read, so two workers can never both see the same tokens or
+the same remaining budget. LIMITS_PATH sets the file that is shared.
+"""
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing, contextmanager
+
+def default_limits_path():
+    return os.getenv('LIMITS_PATH', os.path.join('cache', 'limits.sqlite3'))
+
+def connect_limits(db_path):
+    directory= os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection= sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+@contextmanager
+def immediate_transaction(db_path):
+    with closing(connect_limits(db_path)) as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+"""
+The SharedTokenBucket class is a token bucket: it holds up to capacity tokens, gains rate tokens every second and every request takes one token.
+When the bucket is empty acquire waits until a token has been added, so short bursts of up to capacity requests go out right away while the long
+run average never goes above rate requests per second. The tokens of each named bucket (one per upstream, such as cfbd or openai) live in the
+shared file, so the rate holds across every process together.
+"""
+class SharedTokenBucket:
+    def __init__(self, name, rate, capacity=None, db_path=None):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.name= name
+        self.rate= float(rate)
+        self.capacity= float(capacity if capacity is not None else max(1.0, rate))
+        self.db_path= db_path or default_limits_path()
+        with immediate_transaction(self.db_path) as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            connection.execute("INSERT OR IGNORE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)", (self.name, self.capacity, time.time()))
+
+    def try_acquire(self, tokens=1):
+        with immediate_transaction(self.db_path) as connection:
+            now= time.time()
+            stored_tokens, updated= connection.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            available= min(self.capacity, stored_tokens + max(0.0, now - updated) * self.rate)
+            if available >= tokens:
+                connection.execute("UPDATE token_buckets SET tokens = ?, updated = ? WHERE name = ?", (available - tokens, now, self.name))
+                return 0.0
+            connection.execute("UPDATE token_buckets SET tokens = ?, updated = ? WHERE name = ?", (available, now, self.name))
+            return (tokens - available) / self.rate
+
+    def acquire(self, tokens=1):
+        while True:
+            wait= self.try_acquire(tokens)
+            if wait == 0.0:
+                return
+            time.sleep(wait)
+
+"""
+The SharedBudget class keeps a dollar budget that all processes spend from. Before a paid request reserve is called with the most the request
+could cost. The reservation only succeeds if the money already spent, plus the money held by other reservations, plus this estimate stays within the
+limit. Once the real cost is known commit turns the reservation into spending, or release gives it back if the request failed. Since the estimate is
+never lower than the real cost, the money spent can never go over the limit no matter how many workers are running. Reservations older than
+stale_after seconds are treated as abandoned by a worker that died and no longer hold money. The money spent is counted per period (the calendar
+month in UTC by default, or 'day', or 'total' for a budget that never starts over), so the limit is a monthly limit and a new month starts from 0
+without anyone deleting the limits file. spent and remaining are plain reads that don't take the write lock, since they run on every page view.
+"""
+BUDGET_PERIODS= {'day': '%Y-%m-%d', 'month': '%Y-%m', 'total': 'total'}
+
+class SharedBudget:
+    def __init__(self, name, limit, db_path=None, stale_after=600, period='month'):
+        if period not in BUDGET_PERIODS:
+            raise ValueError(f"Unknown budget period: {period}")
+        self.name= name
+        self.limit= float(limit)
+        self.db_path= db_path or default_limits_path()
+        self.stale_after= stale_after
+        self.period= period
+        with immediate_transaction(self.db_path) as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS budget_periods (name TEXT NOT NULL, period TEXT NOT NULL, spent REAL NOT NULL, "
+                               "PRIMARY KEY (name, period))")
+            connection.execute("CREATE TABLE IF NOT EXISTS budget_reservations (id TEXT PRIMARY KEY, name TEXT NOT NULL, amount REAL NOT NULL, "
+                               "created REAL NOT NULL)")
+
+    def current_period(self, now=None):
+        return time.strftime(BUDGET_PERIODS[self.period], time.gmtime(now if now is not None else time.time()))
+
+    def _held(self, connection, now):
+        row= connection.execute("SELECT spent FROM budget_periods WHERE name = ? AND period = ?", (self.name, self.current_period(now))).fetchone()
+        reserved= connection.execute("SELECT COALESCE(SUM(amount), 0) FROM budget_reservations WHERE name = ? AND created >= ?",
+                                     (self.name, now - self.stale_after)).fetchone()[0]
+        return (row[0] if row else 0.0), reserved
+
+    def reserve(self, amount):
+        with immediate_transaction(self.db_path) as connection:
+            now= time.time()
+            connection.execute("DELETE FROM budget_reservations WHERE name = ? AND created < ?", (self.name, now - self.stale_after))
+            spent, reserved= self._held(connection, now)
+            if spent + reserved + amount > self.limit:
+                return None
+            reservation_id= uuid.uuid4().hex
+            connection.execute("INSERT INTO budget_reservations (id, name, amount, created) VALUES (?, ?, ?, ?)",
+                               (reservation_id, self.name, amount, now))
+            return reservation_id
+
+    def commit(self, reservation_id, cost):
+        with immediate_transaction(self.db_path) as connection:
+            period= self.current_period()
+            connection.execute("DELETE FROM budget_reservations WHERE id = ?", (reservation_id,))
+            connection.execute("INSERT OR IGNORE INTO budget_periods (name, period, spent) VALUES (?, ?, 0)", (self.name, period))
+            connection.execute("UPDATE budget_periods SET spent = spent + ? WHERE name = ? AND period = ?", (cost, self.name, period))
+
+    def release(self, reservation_id):
+        with immediate_transaction(self.db_path) as connection:
+            connection.execute("DELETE FROM budget_reservations WHERE id = ?", (reservation_id,))
+
+    def spent(self):
+        with closing(connect_limits(self.db_path)) as connection:
+            return self._held(connection, time.time())[0]
+
+    def remaining(self):
+        with closing(connect_limits(self.db_path)) as connection:
+            spent, reserved= self._held(connection, time.time())
+            return self.limit - spent - reserved
+
+    def reset(self):
+        with immediate_transaction(self.db_path) as connection:
+            connection.execute("DELETE FROM budget_reservations WHERE name = ?", (self.name,))
+            connection.execute("DELETE FROM budget_periods WHERE name = ? AND period = ?", (self.name, self.current_period()))
+
+"""
+The money spent so far can be looked at or started over from the command line, for example python -m limits budget openai or
+python -m limits budget openai --reset (which only clears the current period).
+"""
+def main(arguments=None):
+    import argparse
+    parser= argparse.ArgumentParser(description="Look at or reset a shared budget")
+    subcommands= parser.add_subparsers(dest='command', required=True)
+    budget_command= subcommands.add_parser('budget', help="show the money spent in the current period")
+    budget_command.add_argument('name', nargs='?', default='openai')
+    budget_command.add_argument('--period', default=os.getenv('CHATGPT_BUDGET_PERIOD', 'month'), choices=sorted(BUDGET_PERIODS))
+    budget_command.add_argument('--reset', action='store_true', help="start the current period over from 0")
+    args= parser.parse_args(arguments)
+
+    budget= SharedBudget(args.name, limit=0, period=args.period)
+    if args.reset:
+        budget.reset()
+    print(f"{args.name} budget ({budget.current_period()}): {budget.spent():.4f} dollars spent")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,372 @@
+"""
+Overview: The following code times each stage of the request pipeline and exposes the numbers in the Prometheus text format for the /metrics route
+in app.py. A stage is timed by wrapping it in span('stage name'), which adds the duration to the pipeline_stage_seconds histogram and to the list of
+timings of the current request (used for the Server-Timing header). Counters and histograms only take a lock and a few additions per observation,
+so leaving them on costs next to nothing. Setting the METRICS_ENABLED env variable to 0 turns span into a no-op. Collectors are functions that are
+called when /metrics is scraped, which is how the cache hit ratios are read straight from the caches' own counters. Under gunicorn every worker
+is its own process with its own numbers, so each process also copies a snapshot of its metrics into a shared SQLite file (METRICS_PATH) every few
+seconds and whenever it serves a scrape, and the scrape adds up the snapshots of every process. That way whichever worker answers, /metrics reports
+the totals of all of them.
+"""
+import atexit
+import contextvars
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from limits import immediate_transaction
+
+metrics_enabled= os.getenv('METRICS_ENABLED', '1') == '1'
+
+"""
+Latency buckets in seconds. They reach from a cached lookup (about a millisecond) to a slow chatgpt completion (a minute).
+"""
+DEFAULT_BUCKETS= (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def format_labels(names, values, extra=()):
+    pairs= list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped= (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+"""
+The Counter class only goes up, the Gauge class holds a value that is set, and the Histogram class counts observations into cumulative buckets
+along with their sum and count. Each one keeps a value per combination of label values. set_total is for counters that are kept somewhere else
+(such as the hit and miss counters inside the caches) and are copied over when /metrics is scraped.
+"""
+class Counter:
+    kind= 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name= name
+        self.documentation= documentation
+        self.labels= tuple(labels)
+        self._values= {}
+        self._lock= threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key= tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key]= self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        key= tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key]= value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def samples(self):
+        return self.format_samples({tuple(key): value for key, value in self.snapshot()})
+
+    def format_samples(self, values, extra=()):
+        return [(self.name, format_labels(self.labels, key, extra), value) for key, value in sorted(values.items())]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def combined_samples(self, snapshots):
+        totals= {}
+        for _, values in snapshots:
+            for key, value in values:
+                totals[tuple(key)]= self.merge(totals.get(tuple(key)), value)
+        return self.format_samples(totals)
+
+class Gauge(Counter):
+    kind= 'gauge'
+
+    def set(self, value, **labels):
+        key= tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key]= value
+
+    def combined_samples(self, snapshots):
+        samples= []
+        for worker, values in snapshots:
+            samples+= self.format_samples({tuple(key): value for key, value in values}, extra=[('worker', worker)])
+        return samples
+
+class Histogram:
+    kind= 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name= name
+        self.documentation= documentation
+        self.labels= tuple(labels)
+        self.buckets= tuple(buckets) + (float('inf'),)
+        self._values= {}
+        self._lock= threading.Lock()
+
+    def observe(self, value, **labels):
+        key= tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            counts= self._values.get(key)
+            if counts is None:
+                counts= self._values[key]= {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts['buckets'][index]+= 1
+                    break
+            counts['sum']+= value
+            counts['count']+= 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), {'buckets': list(counts['buckets']), 'sum': counts['sum'], 'count': counts['count']}]
+                    for key, counts in self._values.items()]
+
+    def samples(self):
+        return self.format_samples({tuple(key): counts for key, counts in self.snapshot()})
+
+    @staticmethod
+    def merge(total, counts):
+        if total is None:
+            return counts
+        return {'buckets': [a + b for a, b in zip(total['buckets'], counts['buckets'])], 'sum': total['sum'] + counts['sum'],
+                'count': total['count'] + counts['count']}
+
+    combined_samples= Counter.combined_samples
+
+    def format_samples(self, values):
+        samples= []
+        for key, counts in sorted(values.items()):
+            cumulative= 0
+            for bound, count in zip(self.buckets, counts['buckets']):
+                cumulative+= count
+                samples.append((self.name + '_bucket', format_labels(self.labels, key, [('le', format_value(bound))]), cumulative))
+            samples.append((self.name + '_sum', format_labels(self.labels, key), counts['sum']))
+            samples.append((self.name + '_count', format_labels(self.labels, key), counts['count']))
+        return samples
+
+"""
+The SharedSnapshots class keeps the latest snapshot of every process in the shared file, one row per process. A process is named by its pid and a
+random suffix, so a new worker that is handed the pid of an old one doesn't overwrite the old one's numbers. exchange writes the snapshot of one
+process and hands back the snapshots of all of them. A live process writes every flush_interval seconds, so one that hasn't written for retire_after
+seconds has exited: its counters and histograms are added into the retired row and its gauges are dropped. That way the totals keep going up when
+workers are restarted, which is what rate() needs.
+"""
+RETIRED_PROCESS= 'retired'
+
+class SharedSnapshots:
+    def __init__(self, db_path, retire_after=60):
+        self.db_path= db_path
+        self.retire_after= retire_after
+        with immediate_transaction(self.db_path) as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS metric_snapshots (process TEXT PRIMARY KEY, updated REAL NOT NULL, snapshot TEXT NOT NULL)")
+
+    def exchange(self, process, snapshot, metrics_by_name):
+        now= time.time()
+        with immediate_transaction(self.db_path) as connection:
+            connection.execute("INSERT OR REPLACE INTO metric_snapshots (process, updated, snapshot) VALUES (?, ?, ?)", (process, now, json.dumps(snapshot)))
+            rows= connection.execute("SELECT process, updated, snapshot FROM metric_snapshots").fetchall()
+            snapshots= {row_process: json.loads(text) for row_process, _, text in rows}
+            stale= [row_process for row_process, updated, _ in rows if row_process != RETIRED_PROCESS and updated < now - self.retire_after]
+            if stale:
+                retired= snapshots.get(RETIRED_PROCESS, {})
+                for stale_process in stale:
+                    for name, values in snapshots.pop(stale_process).items():
+                        metric= metrics_by_name.get(name)
+                        if metric is None or metric.kind == 'gauge':
+                            continue
+                        totals= {tuple(key): value for key, value in retired.get(name, [])}
+                        for key, value in values:
+                            totals[tuple(key)]= metric.merge(totals.get(tuple(key)), value)
+                        retired[name]= [[list(key), value] for key, value in totals.items()]
+                snapshots[RETIRED_PROCESS]= retired
+                connection.execute("INSERT OR REPLACE INTO metric_snapshots (process, updated, snapshot) VALUES (?, ?, ?)",
+                                   (RETIRED_PROCESS, now, json.dumps(retired)))
+                connection.executemany("DELETE FROM metric_snapshots WHERE process = ?", [(stale_process,) for stale_process in stale])
+        return snapshots
+
+"""
+The Registry class holds every metric and collector. collect runs the collectors. With a shared store, flush writes the snapshot of this process
+(a background thread started by start_flushing does so every flush_interval seconds, once per process) and render_prometheus adds up every
+process's snapshot: counters and histograms are summed and gauges, which can't be added up, get a worker label. Without a store (METRICS_PATH
+set to nothing) render_prometheus only writes the numbers of the process it runs in. Each metric is written with its HELP and TYPE lines.
+"""
+class Registry:
+    def __init__(self, store=None, flush_interval=5.0):
+        self.metrics= []
+        self.collectors= []
+        self.store= store
+        self.flush_interval= flush_interval
+        self._process= None
+        self._flusher_pid= None
+        self._flusher_lock= threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+
+    def process_name(self):
+        if self._process is None or self._process[0] != os.getpid():
+            self._process= (os.getpid(), f"{os.getpid()}-{secrets.token_hex(3)}")
+        return self._process[1]
+
+    def flush(self):
+        if self.store is None:
+            return None
+        self.collect()
+        try:
+            return self.store.exchange(self.process_name(), {metric.name: metric.snapshot() for metric in self.metrics},
+                                       {metric.name: metric for metric in self.metrics})
+        except (sqlite3.Error, OSError) as e:
+            print(f"Metrics store error: {e}")
+            return None
+
+    def start_flushing(self):
+        if self.store is None or self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid= os.getpid()
+            threading.Thread(target=self._flush_forever, daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def render_prometheus(self):
+        snapshots= self.flush()
+        if snapshots is None:
+            self.collect()
+        lines= []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if snapshots is None:
+                samples= metric.samples()
+            else:
+                samples= metric.combined_samples([(process, snapshot.get(metric.name, [])) for process, snapshot in sorted(snapshots.items())])
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+metrics_path= os.getenv('METRICS_PATH', os.path.join('cache', 'metrics.sqlite3'))
+registry= Registry(SharedSnapshots(metrics_path) if metrics_enabled and metrics_path else None,
+                   flush_interval=float(os.getenv('METRICS_FLUSH_SECONDS', '5')))
+atexit.register(registry.flush)
+stage_seconds= registry.histogram('pipeline_stage_seconds', "Time spent in each stage of the request pipeline.", ('stage',))
+request_seconds= registry.histogram('http_request_seconds', "Time spent answering each flask route.", ('route', 'method', 'status'))
+upstream_responses= registry.counter('upstream_responses_total', "Responses from upstream apis by status code.", ('upstream', 'status'))
+cache_events= registry.counter('cache_events_total', "Hits, misses, evictions and the other events of the caches.", ('cache', 'event'))
+cache_state= registry.gauge('cache_state', "Current size of the caches, such as the entries held in memory and the fetches in flight.", ('cache', 'state'))
+cache_hit_ratio= registry.gauge('cache_hit_ratio', "Share of cache lookups that were answered from the cache.", ('cache',))
+openai_tokens= registry.counter('openai_tokens_total', "Tokens used by OpenAI completions.", ('kind',))
+openai_cost= registry.counter('openai_cost_dollars_total', "Dollars spent on OpenAI completions.")
+openai_request_cost= registry.histogram('openai_request_cost_dollars', "Dollars spent on the OpenAI completion of each request.",
+                                        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+openai_request_tokens= registry.histogram('openai_request_tokens', "Tokens used by the OpenAI completion of each request.", ('kind',),
+                                          buckets=(25, 50, 100, 250, 500, 750, 1000, 2000, 4000))
+
+"""
+request_timings holds the list of (stage, seconds) timings of the request that is being answered. It is a context variable so every flask request
+has its own list. Threads don't inherit context variables, so work that is handed to a thread pool is submitted with submit_in_context, which runs
+it inside a copy of the current context (the copy still points at the same list).
+"""
+request_timings= contextvars.ContextVar('request_timings', default=None)
+
+def start_request_timing():
+    registry.start_flushing()
+    request_timings.set([])
+
+def submit_in_context(executor, function, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, function, *args, **kwargs)
+
+@contextmanager
+def span(stage):
+    if not metrics_enabled:
+        yield
+        return
+    registry.start_flushing()
+    start= time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed= time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        timings= request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+"""
+server_timing_header adds up the timings of each stage of the current request (a stage such as cfbd_stats can happen more than once) and writes
+them in the format of the Server-Timing header, in milliseconds, so the breakdown shows up in the browser's developer tools.
+"""
+def server_timing_header(total_seconds=None):
+    totals= {}
+    for stage, elapsed in request_timings.get() or ():
+        count, seconds= totals.get(stage, (0, 0.0))
+        totals[stage]= (count + 1, seconds + elapsed)
+    entries= [f'{stage};dur={seconds * 1000:.1f};desc="{count}x"' for stage, (count, seconds) in totals.items()]
+    if total_seconds is not None:
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ', '.join(entries)
+
+def record_upstream_status(upstream, status):
+    if metrics_enabled:
+        upstream_responses.inc(upstream=upstream, status=status)
+
+def record_openai_usage(prompt_tokens, completion_tokens, cost):
+    if metrics_enabled:
+        openai_tokens.inc(prompt_tokens, kind='prompt')
+        openai_tokens.inc(completion_tokens, kind='completion')
+        openai_cost.inc(cost)
+        openai_request_cost.observe(cost)
+        openai_request_tokens.observe(prompt_tokens, kind='prompt')
+        openai_request_tokens.observe(completion_tokens, kind='completion')
+
+"""
+watch_cache registers a collector that copies a cache's stats() into the metrics every time /metrics is scraped. The event counters of a cache only
+go up, so they are exported as the cache_events_total counter (which rate() works on), while the sizes in CACHE_STATE_STATS go into the cache_state
+gauge. The hit ratio is worked out from the hit and miss counters when the cache doesn't report one itself.
+"""
+CACHE_STATE_STATS= ('memory_entries', 'in_flight')
+
+def watch_cache(name, cache):
+    def collect():
+        stats= cache.stats()
+        for event, value in stats.items():
+            if event in CACHE_STATE_STATS:
+                cache_state.set(value, cache=name, state=event)
+            elif event != 'hit_ratio':
+                cache_events.set_total(value, cache=name, event=event)
+        if 'hit_ratio' in stats:
+            cache_hit_ratio.set(stats['hit_ratio'], cache=name)
+        else:
+            lookups= stats.get('hits', 0) + stats.get('misses', 0)
+            cache_hit_ratio.set(stats.get('hits', 0) / lookups if lookups else 0.0, cache=name)
+    registry.add_collector(collect)
@@ -9,77 +9,211 @@ tasks.
 The following code refers to the libraries imported into the python file. For any user know of all
 necessary library imports, a requirements.txt file was created. Matplotlib is imported to allow for the creation
 of a football field with annotations consisting of the top 5 players based on usage rate along with their predicted
-points added plus other data analytics. Agg is a non interactive backend that enables the writing of files
-such as png. An alias is made for the pyplot module as plt. This is within the same matplotlib library. os is imported as
+points added plus other data analytics. Figure and FigureCanvasAgg are imported from the same matplotlib library so every image is drawn
+on its own figure with Agg, a non interactive backend that produces the pixels of the image. Line2D and Affine2D are used to place the
+markers and text on the field without making a set of axes. numpy holds those pixels and PIL opens the
+background and saves the finished png. io is imported to allow an image to be saved into memory. os is imported as
 well to allow the os to access env variables(from dotenv import load_dotenv). Requests is imported for the purpose
 of making api requests and concurrent features imports ThreadPoolExecutor and as_completed for concurrent api requests.
-This promotes more efficent run times.
+This promotes more efficent run times. ResponseCache is imported from apicache.py so repeated api requests are answered from a cache
+UsageIndex is imported from usageindex.py to look up the players with the highest usage rate on a team and RenderCache is imported from
+rendercache.py so a field image that was already drawn for a query is reused. SharedTokenBucket is imported from limits.py to limit how fast
+requests are sent to CFBD by every worker together and the timing helpers from metrics.py record how long each stage takes.
 """
-import matplotlib
-matplotlib.use('Agg')
+import io
 import os
 from dotenv import load_dotenv
 import requests
-import matplotlib.pyplot as plt
+from requests.adapters import HTTPAdapter
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.lines import Line2D
+from matplotlib.transforms import Affine2D
 from PIL import Image
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from apicache import ResponseCache, normalize_params
+from usageindex import UsageIndex
+from rendercache import RenderCache
+from limits import SharedTokenBucket
+from metrics import span, submit_in_context, record_upstream_status, watch_cache
 
+"""
+The response cache is made once when the module is imported. The disk tier lives in a SQLite file whose path can be changed with the
+CFBD_CACHE_PATH env variable and the size of the in-memory tier can be changed with CFBD_CACHE_MAX_ENTRIES.
+"""
+load_dotenv()
+response_cache= ResponseCache(db_path=os.getenv('CFBD_CACHE_PATH', os.path.join('cache', 'cfbd_cache.sqlite3')),
+                              max_entries=int(os.getenv('CFBD_CACHE_MAX_ENTRIES', '256')))
+watch_cache('cfbd', response_cache)
+
+"""
+request_the_api is the function every other function calls for CFBD data. It hands the endpoint and parameters to the response cache, which
+only calls fetch_from_the_api when neither the memory tier nor the disk tier has a fresh copy of the response. The headers are left out of the
+cache key since they only carry the authorization token. The parameters are normalized once and the same normalized parameters make up the key
+and are sent to the api, so a response is always stored under the key of the request that was actually made.
+"""
+def request_the_api(endpoint, headers, params):
+    params= normalize_params(params)
+    return response_cache.get_or_fetch(endpoint, params, lambda: fetch_from_the_api(endpoint, headers, params))
+"""
+All CFBD requests share one requests.Session so connections to the api are kept alive and reused instead of opening a new TCP and TLS
+connection for every call. The session's connection pool and the request_slots semaphore are both sized by CFBD_MAX_CONCURRENCY, which bounds how
+many requests can be in flight at once across every thread. CFBD_CONNECT_TIMEOUT and CFBD_READ_TIMEOUT set the timeouts of each request and
+CFBD_API_URL allows the api to be pointed at another server (such as the local stub server used by the benchmarks).
+"""
+api_url= os.getenv('CFBD_API_URL', 'https://api.collegefootballdata.com/')
+max_concurrent_requests= int(os.getenv('CFBD_MAX_CONCURRENCY', '8'))
+request_timeout= (float(os.getenv('CFBD_CONNECT_TIMEOUT', '5')), float(os.getenv('CFBD_READ_TIMEOUT', '30')))
+request_slots= threading.BoundedSemaphore(max_concurrent_requests)
+session= requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent_requests))
+session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent_requests))
+"""
+upstream_limiter is an optional SharedTokenBucket that every request to CFBD has to take a token from before it is sent. The bucket lives in the
+shared limits file, so the rate holds across every worker process and the warm command together. It is off unless the CFBD_RATE_LIMIT env variable
+(requests per second) is set or set_upstream_rate_limit is called, as the warm command does. CFBD_RATE_BURST sets how many requests can go out at once.
+"""
+upstream_limiter= None
+
+def set_upstream_rate_limit(requests_per_second, burst=None):
+    global upstream_limiter
+    upstream_limiter= SharedTokenBucket('cfbd', requests_per_second, capacity=burst) if requests_per_second else None
+
+set_upstream_rate_limit(float(os.getenv('CFBD_RATE_LIMIT', '0')), burst=float(os.getenv('CFBD_RATE_BURST', '0')) or None)
 """
 The purpose of this function is to make http requests to the api in order to pull the requested data. The requested data is specified through endpoints
 and parameters that pull the data wanted. If the api request is succesful, a 200 code is received. Then the JSON response is a list of dictionaries
-consisting of data. If the request is unsuccessful, an error is returned along with details regarding the error.
+consisting of data. If the request is unsuccessful or times out, an error is returned along with details regarding the error.
 """
-def request_the_api(endpoint, headers, params):
-    api_url= 'https://api.collegefootballdata.com/'
+def fetch_from_the_api(endpoint, headers, params):
     requested_url= api_url + endpoint
     print(f"API Request URL: {requested_url}")
-    the_response= requests.get(requested_url, headers=headers, params=params)
+    if upstream_limiter is not None:
+        upstream_limiter.acquire()
+    try:
+        with request_slots:
+            the_response= session.get(requested_url, headers=headers, params=params, timeout=request_timeout)
+    except requests.RequestException as e:
+        print(f"Error: request to {requested_url} failed - {e}")
+        record_upstream_status('cfbd', 'error')
+        return None
+    record_upstream_status('cfbd', the_response.status_code)
     if the_response.status_code==200:
         return the_response.json()
     else:
         print(f"Error: {the_response.status_code} - {the_response.text}")
         return None
 """
-The following victoryformation function will utilize matplotlib's library to open a football field jpg and edit it into becoming an edited png image. 
-First the original football image is opened and then converted into a 12 by 8 figure. Then the player count and spacing(to create y coords for each player's data)
-is figured out. Next for every player in the players_data list that consists of the top 5 players in usage rate, each player has data pulled from their dictionary in players_data. 
-A marker for the player is placed following the pulling of some data. Then for each player a main_info text line consisting of the player name, usage rate and
-ppa is made. A text piece is next made called ydtd_info, which stores the player stat category and stats for that player(yds and tds only). The main_info and ydtd_info
-text pieces are then stored near the player's respective marker and are spaced along the x axis of the figure. After each player has been looked at in
-players_data, a team annotation is created from team_info. The team_annotation is then placed in the top right corner of the figure to display the team name,
-team record and conference of the team. The figure then sets limits and is saved as a png image.
+The field background is decoded once when the module is imported instead of on every call. FIELD_BACKGROUND picks the background image, which
+is static/football.jpg by default (static/cfb_field.webp can be used instead). A relative path is found from the folder this file is in rather than
+the folder the process was started from, so importing obtaindata (and app, compare or the benchmarks) works from any folder. load_field_canvas then draws the background with its axes onto
+a 12 by 8 Agg canvas a single time and keeps the finished image as field_canvas, so a render only has to draw the players and lay them over it. The y axis
+goes up from 0 so the players can be placed from the top down, which means the rows of the image are flipped and drawn with origin='lower' to keep the
+background upright (the old pyplot version drew it upside down, which only went unnoticed because football.jpg is symmetric). The x coordinates of the
+markers and text were laid out on the 473 pixel wide football.jpg, so they are scaled to the width of whichever background is used. RENDERER_VERSION is
+part of the render cache key and has to be bumped whenever the drawing changes so old images aren't served for the new drawing.
 """
-def victoryformation(players_data, team_info):
-    plt.figure(figsize=(12,8))
-    field_img= Image.open('static/football.jpg')
-    plt.imshow(field_img)
+LAYOUT_WIDTH= 473
+RENDERER_VERSION= 2
+module_folder= os.path.dirname(os.path.abspath(__file__))
+static_folder= os.path.join(module_folder, 'static')
+
+def load_field_canvas(background_path):
+    with Image.open(background_path) as field_img:
+        background= np.asarray(field_img.convert('RGB'))
+    figure= Figure(figsize=(12,8))
+    canvas= FigureCanvasAgg(figure)
+    axes= figure.add_subplot()
+    axes.imshow(np.flipud(background), origin='lower')
+    axes.set_xlim(0, background.shape[1])
+    axes.set_ylim(0, background.shape[0])
+    canvas.draw()
+    return {'image': Image.fromarray(np.asarray(canvas.buffer_rgba()).copy()), 'position': axes.get_position(),
+            'width': background.shape[1], 'height': background.shape[0], 'path': background_path}
+
+field_canvas= load_field_canvas(os.path.join(module_folder, os.getenv('FIELD_BACKGROUND', os.path.join('static', 'football.jpg'))))
+"""
+The following victoryformation function will utilize matplotlib's library to draw the data of the top 5 players onto the football field and save it as
+an image. A new transparent Figure with its own FigureCanvasAgg is made for every call instead of using pyplot, which keeps pyplot's global state out of the
+way and lets several threads draw at the same time. No axes are made. Instead field_transform turns the pixel coordinates of the background into the spot
+the background's axes took up on the pre-drawn field_canvas. Then the player count and spacing(to create y coords for each player's data) is figured out.
+Next for every player in the players_data list that consists of the top 5 players in usage rate, each player has data pulled from their dictionary in
+players_data. Then for each player a main_info text line consisting of the player name, usage rate and ppa is made. A text piece is next made called
+ydtd_info, which stores the player stat category and stats for that player(yds and tds only). The main_info and ydtd_info text pieces are then stored
+near the player's marker and are spaced along the x axis of the figure. The markers of every player are drawn together as one line of red dots. After
+each player has been looked at in players_data, a team annotation is created from team_info. The team_annotation is then placed in the top right corner
+of the figure to display the team name, team record and conference of the team. The canvas is drawn and laid over the field_canvas image with
+alpha_composite, then saved with PIL at output_path using the png or webp format that matches the file extension unless image_format is given. If
+output_path is None the image is returned as bytes instead of being written to a file.
+"""
+def victoryformation(players_data, team_info, output_path=os.path.join(static_folder, 'field_plot.png'), image_format=None):
+    figure= Figure(figsize=(12,8))
+    figure.patch.set_alpha(0)
+    canvas= FigureCanvasAgg(figure)
+    width= field_canvas['width']
+    height= field_canvas['height']
+    position= field_canvas['position']
+    field_transform= Affine2D().scale(position.width / width, position.height / height).translate(position.x0, position.y0) + figure.transFigure
+    scale= width / LAYOUT_WIDTH
 
     player_num= len(players_data)
-    space= field_img.height/(player_num+1)
+    space= height/(player_num+1)
 
+    marker_y_coords= []
     for i, player in enumerate(players_data):
         usage_rate= player.get('usage', {}).get('overall', 0.0)
         ppa= player.get('averagePPA', 0.0)
-        y_coord= field_img.height - (i+1) * space
-        plt.scatter(100, y_coord, color='red', s=50, marker='o')
-        
+        y_coord= height - (i+1) * space
+        marker_y_coords.append(y_coord)
+
         main_info= f"{player.get('name', 'Unknown')}\nUsage Rate: {usage_rate:.4f}\nAvg. PPA: {ppa:.4f}"
         player_position= player.get('position', 'Unknown')
         player_category= obtain_playerST_category(player_position)
         ydtd_info= generate_stats_info(player, player_category)
 
-        plt.text(125, y_coord, main_info, fontsize=10, color='black', ha='left', va='center', fontweight='bold')
-        plt.text(350, y_coord, ydtd_info, fontsize=10, color='black',  ha='left', va='center', fontweight='bold')
+        figure.text(125 * scale, y_coord, main_info, fontsize=10, color='black', ha='left', va='center', fontweight='bold', transform=field_transform)
+        figure.text(350 * scale, y_coord, ydtd_info, fontsize=10, color='black',  ha='left', va='center', fontweight='bold', transform=field_transform)
+    figure.add_artist(Line2D([100 * scale] * player_num, marker_y_coords, linestyle='', marker='o', markersize=50 ** 0.5, color='red',
+                             transform=field_transform))
     team_annotation= f"Team: {team_info.get('team', 'Unknown')}\nConference: {team_info.get('conference', 'Unknown')}\nRecord: {team_info.get('total', {}).get('wins', 'Unknown')}-{team_info.get('total', {}).get('losses', 'Unknown')}-{team_info.get('total', {}).get('ties', 'Unknown')}"
-    plt.text(field_img.width - 10, field_img.height-10, team_annotation, fontsize=10, color='black', ha='right', va='top', fontweight='bold')
-    plt.xlim(0, field_img.width)
-    plt.ylim(0, field_img.height)
-    plt.savefig('static/field_plot.png')
-    plt.close()
+    figure.text(width - 10, height-10, team_annotation, fontsize=10, color='black', ha='right', va='top', fontweight='bold', transform=field_transform)
+    canvas.draw()
+
+    if image_format is None:
+        image_format= os.path.splitext(output_path)[1].lstrip('.') if output_path else 'png'
+    image_format= image_format.lower()
+    field_plot= Image.alpha_composite(field_canvas['image'], Image.fromarray(np.asarray(canvas.buffer_rgba()))).convert('RGB')
+    save_options= {'compress_level': 1} if image_format == 'png' else {'quality': 90, 'method': 0}
+    if output_path is None:
+        image_buffer= io.BytesIO()
+        field_plot.save(image_buffer, format=image_format, **save_options)
+        return image_buffer.getvalue()
+    field_plot.save(output_path, format=image_format, **save_options)
+    return output_path
+"""
+Drawn field images are kept in a RenderCache inside the static folder so flask can serve them directly. The folder can be changed with the
+FIELD_RENDER_DIR env variable (it has to stay inside static and a relative path is found from this file's folder, like FIELD_BACKGROUND), its size limit in megabytes with FIELD_RENDER_CACHE_MB and the image format (png
+or webp) with FIELD_RENDER_FORMAT. The background path and RENDERER_VERSION are part of every key, so changing FIELD_BACKGROUND or the drawing
+makes new images instead of serving old ones. render_field_image
+returns the file name of the query's image relative to the static folder, only calling victoryformation when the image isn't cached yet.
+"""
+render_cache= RenderCache(os.path.join(module_folder, os.getenv('FIELD_RENDER_DIR', os.path.join('static', 'renders'))),
+                          max_bytes=int(float(os.getenv('FIELD_RENDER_CACHE_MB', '200')) * 1024 * 1024),
+                          extension=os.getenv('FIELD_RENDER_FORMAT', 'png'),
+                          variant=[field_canvas['path'], RENDERER_VERSION])
+watch_cache('render', render_cache)
+
+def render_field_image(team, year, players_data, team_info):
+    with span('render'):
+        image_path= render_cache.get_or_render(team, year, players_data, team_info,
+                                               lambda output_path: victoryformation(players_data, team_info, output_path))
+    return os.path.relpath(image_path, static_folder).replace(os.sep, '/')
 """
 The purpose of generate stats is to obtain the yds and tds from a specific player. In this process the player category, yds and stats are
 seperated line by line for the detailing of the football field. Throughout the duration of this process it is also ensured that the data filtering done
-in gather_ppa_and_stats was correct by double checking if there are in fact stats, if the player category filtering was done and if the player names
+in concurrent_assigning_of_player_data was correct by double checking if there are in fact stats, if the player category filtering was done and if the player names
 match. A string consisting of a player category, statype(yds) plus a stat (# of yards) and statype(tds) plus a stat (# of tds).
 """
 def generate_stats_info(player, player_category):
@@ -92,105 +226,165 @@ def generate_stats_info(player, player_category):
     else:
         return f"{player_category.capitalize()}\nNo stats available"
 """
-The following function below will take in headers, a year and a team to return a sorted list of the top 5 players on a team by usage rate. In the function
-a request is made to the api with the usage rate endpoints and parameters. If the request is unsuccesful an error should be returned. If the request is
-successful, a list of dictionaries of each player from a certain season is made as usage_data. Usage_data is then filtered through to make players_from_team,
-which just makes the list of dictionaries consist of all players from a certain team in a certain year. If no players are found on the team, none is returned.
-Next the top 5 players based on usage rate are stored as a list of dictionaires in sorted_players and then returned.
+The player/usage payload covers every FBS player in a season, so instead of scanning and sorting it on every request a UsageIndex is built
+once per year and kept in usage_indexes. get_usage_index requests the payload (normally answered by the response cache) and only rebuilds the
+index when the cache hands back a different payload object, which happens after the cached entry expires or is reloaded from disk. The lock
+makes sure two threads asking for the same year don't both build the index.
 """
-def get_top5_usage_players(headers, year, team):
+usage_indexes= {}
+usage_index_lock= threading.Lock()
+
+def get_usage_index(headers, year):
     endpoint_usage= 'player/usage'
     parameters_usage= {'year': year}
-    usage_data= request_the_api(endpoint_usage, headers=headers, params=parameters_usage)
+    with span('cfbd_usage'):
+        usage_data= request_the_api(endpoint_usage, headers=headers, params=parameters_usage)
     if not usage_data:
         return None
-    
-    players_from_team= [player for player in usage_data if player.get('team') == team]
-    if not players_from_team:
+    year_key= str(year).strip()
+    with usage_index_lock:
+        cached= usage_indexes.get(year_key)
+        if cached is None or cached[0] is not usage_data:
+            cached= (usage_data, UsageIndex(usage_data))
+            usage_indexes[year_key]= cached
+    return cached[1]
+"""
+The following function below will take in headers, a year and a team to return a sorted list of the top n players on a team by usage rate. The usage
+index for the year is obtained and if the request for the usage data was unsuccesful none is returned. The index then gives back the top n players
+of the team for the chosen usage split (overall by default, but pass, rush, thirdDown and the other splits work too). If no players are found on the
+team, none is returned. The player dictionaries returned are copies because the players get updated with ppa and stats later on.
+get_top5_usage_players keeps the original behavior of returning the top 5 players by overall usage rate.
+"""
+def get_top_usage_players(headers, year, team, n=5, split='overall'):
+    usage_index= get_usage_index(headers, year)
+    if usage_index is None:
+        return None
+    sorted_players= usage_index.top_players(team, n=n, split=split)
+    if not sorted_players:
         print(f"No players found on team {team} in {year}")
         return None
-    sorted_players= sorted(players_from_team, key=lambda x: x.get('usage', {}).get('overall', 0.0), reverse=True)[:5]
     return sorted_players
+
+def get_top5_usage_players(headers, year, team):
+    return get_top_usage_players(headers, year, team, n=5)
+"""
+The function plan_player_requests works out the smallest set of api requests needed to fill in the ppa and stats of every player in sorted_players.
+The ppa/players/season endpoint returns every player on a team when no player is given, so a single ppa request covers the whole roster. The
+stats/player/season endpoint returns a whole team's stats for one category, so one stats request is planned for each distinct category among the
+players. Two WRs and a TE therefore share one receiving request. Players whose position has no stat category (unknown) don't need a stats request.
+Each planned request is a (key, endpoint, parameters) tuple where the key is either 'ppa' or the stat category.
 """
-The function concurrent_assigning_of_player_data has headers, year, team and sorted_players as parameters. This function also contains the nested function
-gather_ppa_and_stats. The function's purpose is to update the dictionaries of each player in the sorted_players list with a ppa value and a stats category.
-Initially the endpoints are set up for the ppa and stats api requests. Then comes the usage of threads to complete tasks concurrently. Through searching the
-web I learned about threads and was able to use them in this project. Threads are the smallest unti of execution within a process. A collection of threads
-ready to be assigned to a task is called a thread pool. A ThreadPoolExecutor allows for each task to be completed by assigning tasks to each thread in the
-thread pool. The ThreadPoolExecutor itself manages the number of threads and provides ways to handle the lifecycle of these threads for the user. In this
-code below ThreadPoolExecutor is utilized as the executor to enforce the concurrent execution of tasks by threads. Then futures= {executor.submit(gather_ppa_and_stats, player): player for player in sorted_players}
-submits the gather_ppa_and_stats function to the thread pool for each player. The futures dictionary then stores each key as a future object and the value
-of each object is the corresponding player. Then as each future completes, it is returned in as_completed(futures). The player_name and results are obtained
-from the result of that future or thread execution of a given player's fetch_ppa_and_stats. Then we look through each player in sorted players, to see if their
-name matches the returned player name from the future result. Then the player's dictionary is updated with the future's returned results(dictionary of stats).
-The gather_ppa_and_stats function is what makes api requests for the ppa and stats for each player. The data collected is placed in that player's results dictionary and both the player_name and
-results dictionary are returned. The understanding gather_ppa_and_stats function is the simpler part of this function process.
+def plan_player_requests(year, team, sorted_players):
+    planned_requests= [('ppa', 'ppa/players/season', {'year': year, 'team': team})]
+    planned_categories= set()
+    for player in sorted_players:
+        player_category= obtain_playerST_category(player.get('position'))
+        if player_category != 'unknown' and player_category not in planned_categories:
+            planned_categories.add(player_category)
+            planned_requests.append((player_category, 'stats/player/season', {'year': year, 'team': team, 'category': player_category}))
+    return planned_requests
+"""
+The function concurrent_assigning_of_player_data has headers, year, team and sorted_players as parameters. The function's purpose is to update the dictionaries
+of each player in the sorted_players list with a ppa value and a stats category. Through searching the web I learned about threads and was able to use them in
+this project. Threads are the smallest unti of execution within a process. A collection of threads ready to be assigned to a task is called a thread pool. A
+ThreadPoolExecutor allows for each task to be completed by assigning tasks to each thread in the thread pool. First the requests planned by plan_player_requests
+are submitted to the thread pool so each team-level request runs exactly once and at the same time as the others. As each future completes in as_completed(futures)
+its response is stored under its key in responses. The team-level responses are then turned into dictionaries keyed by player name (ppa_by_name and the lists
+of stats in stats_by_category), so each player's averagePPA and stats are found with a dictionary lookup instead of scanning the responses once per player.
+Each request is timed as a cfbd_ppa or cfbd_stats span and is submitted with submit_in_context so the timing is added to the current flask request.
 """
 def concurrent_assigning_of_player_data(headers, year, team, sorted_players):
-    endpoint_ppa= 'ppa/players/season'
-    endpoint_stats= 'stats/player/season'
+    planned_requests= plan_player_requests(year, team, sorted_players)
+    responses= {}
 
-    def gather_ppa_and_stats(player):
-        player_name= player.get('name')
-        results={}
+    def fetch_planned(key, endpoint, params):
+        with span('cfbd_ppa' if key == 'ppa' else 'cfbd_stats'):
+            return request_the_api(endpoint, headers=headers, params=params)
 
-        parameters_ppa={'year': year, 'team': team, 'player': player_name}
-        ppa_data= request_the_api(endpoint_ppa, headers=headers, params=parameters_ppa)
-        if ppa_data:
-            player_ppa= next((item for item in ppa_data if item.get('name') == player_name), {})
-            results['averagePPA']= player_ppa.get('averagePPA', {}).get('all', 0.0)
-        else:
-            print(f"Failed to obtain predicted points added for {player.get('name', 'Unknown')}")
+    with ThreadPoolExecutor(max_workers=len(planned_requests)) as executor:
+        futures= {submit_in_context(executor, fetch_planned, key, endpoint, params): key for key, endpoint, params in planned_requests}
+        for future in as_completed(futures):
+            responses[futures[future]]= future.result()
 
-        player_category= obtain_playerST_category(player['position'])
-        parameters_stats= {'year': year, 'team': player['team'], 'category': player_category}
-        player_stats= request_the_api(endpoint_stats, headers=headers, params=parameters_stats)
+    ppa_data= responses.pop('ppa')
+    if ppa_data:
+        ppa_by_name= {item.get('name'): item for item in ppa_data}
+    else:
+        ppa_by_name= None
+        print(f"Failed to obtain predicted points added for {team}")
+    stats_by_category= {}
+    for player_category, player_stats in responses.items():
         if player_stats:
-            individual_player_stats= [item for item in player_stats if item.get('player') == player_name]
-            results['stats']= individual_player_stats
+            stats_by_name= {}
+            for item in player_stats:
+                stats_by_name.setdefault(item.get('player'), []).append(item)
+            stats_by_category[player_category]= stats_by_name
         else:
-            print(f"Failed to obtain stats for {player.get('name', 'Unknown')}")
-        return player_name, results
-    
-    with ThreadPoolExecutor() as executor:
-        futures= {executor.submit(gather_ppa_and_stats, player): player for player in sorted_players}
-        for future in as_completed(futures):
-            player_name, results= future.result()
-            for player in sorted_players:
-                if player['name'] == player_name:
-                    player.update(results)
-                    break
+            print(f"Failed to obtain {player_category} stats for {team}")
+
+    for player in sorted_players:
+        player_name= player.get('name')
+        if ppa_by_name is not None:
+            player['averagePPA']= ppa_by_name.get(player_name, {}).get('averagePPA', {}).get('all', 0.0)
+        stats_by_name= stats_by_category.get(obtain_playerST_category(player.get('position')))
+        if stats_by_name is not None:
+            player['stats']= stats_by_name.get(player_name, [])
 """
-The following code below refers to the get_team_data function that builds the detailed football field image of the top 5 players sorted by usage rate on a given team
-in a given year. The function also returns a sorted_players list and team_info dictionary. First the function loads the CFBD api key from the environment variable.
-The headers are then set for the api request utilizing the authorization the api key provides(this only happens if an api key existed for CFBD). Next the sorted_players 
-list is made from the get_top5_usage_players function. If no such players exist, none is returned. Following the guarantee that the sorted_player list exists,
-the concurrent_assigning_of_player_data function is called to add new data such as ppa and stats to each players dictionary in sorted_players. Then 
-the request is made for the team records data utilzing the unique records endpoint and parameters. Given that records_data was able to be pulled from
-the api, then victoryformation is called to detail and customize the field according to the data analytics that were retrieved from CFBD. Sorted_players
-is then returned along with records_data[0] to allow for the data in those data structures to be passed to app.py where get_team_data will be called.
-Now if records_data couldn't be found, an error is returned and none is returned.
+The following function fetch_team_data gathers all of the CFBD data for a given team in a given year without drawing anything. The records request
+doesn't depend on the usage data, so it is submitted to a thread right away and runs while the top 5 players are found from get_top5_usage_players and
+while concurrent_assigning_of_player_data adds ppa and stats to each players dictionary. If no players exist or records_data couldn't be found, an error
+is returned and none is returned. Otherwise sorted_players is returned along with a copy of records_data[0], since the original belongs to the
+response cache.
 """
-def get_team_data(year, team):
+def fetch_team_data(headers, year, team):
+    def fetch_records():
+        endpoint_records= 'records'
+        parameters_records= {'year': year, 'team': team}
+        with span('cfbd_records'):
+            return request_the_api(endpoint_records, headers=headers, params=parameters_records)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        records_future= submit_in_context(executor, fetch_records)
+        sorted_players= get_top5_usage_players(headers, year, team)
+        if sorted_players:
+            concurrent_assigning_of_player_data(headers, year, team, sorted_players)
+        records_data= records_future.result()
+    if not sorted_players:
+        return None, None
+    if records_data:
+        return sorted_players, dict(records_data[0])
+    else:
+        print(f"Unable to retrieve team info for {team}")
+        return None, None
+"""
+cfbd_headers loads the CFBD api key from the environment variable and returns the headers for the api request utilizing the authorization the api key
+provides. If no api key exists, an error is printed and None is returned.
+"""
+def cfbd_headers():
     load_dotenv()
     api_key= os.getenv('CFBD_API_KEY')
     if api_key is None:
         print("API_Key env variable has not been created yet")
+        return None
+    return {'Authorization': f'Bearer {api_key}'}
+"""
+The following code below refers to the get_team_data function that builds the detailed football field image of the top 5 players sorted by usage rate on a given team
+in a given year. The function also returns a sorted_players list and team_info dictionary. First the headers are made by cfbd_headers (this only happens if an
+api key existed for CFBD). Next the sorted_players 
+list and team_info dictionary are made from the fetch_team_data function. If no such data exists, none is returned. Given that the data was able to be pulled from
+the api, then render_field_image is called to detail and customize the field according to the data analytics that were retrieved from CFBD (or to find
+the image that was already drawn for the same data). The image's file name is stored in team_info under field_image for results.html. Sorted_players
+is then returned along with team_info to allow for the data in those data structures to be passed to app.py where get_team_data will be called.
+"""
+def get_team_data(year, team):
+    headers= cfbd_headers()
+    if headers is None:
         return None, None
-    headers= {'Authorization': f'Bearer {api_key}'}
-    sorted_players= get_top5_usage_players(headers, year, team)
+    sorted_players, team_info= fetch_team_data(headers, year, team)
     if not sorted_players:
-        return None,None
-    concurrent_assigning_of_player_data(headers, year, team, sorted_players)
-    endpoint_records= 'records'
-    parameters_records= {'year': year, 'team': team}
-    records_data= request_the_api(endpoint_records, headers=headers, params=parameters_records)
-    if records_data:
-        victoryformation(sorted_players, records_data[0])
-        return sorted_players, records_data[0]
-    else:
-        print(f"Unable to retrieve team info for {team}")
         return None, None
+    team_info['field_image']= render_field_image(team, year, sorted_players, team_info)
+    return sorted_players, team_info
 """
 The following function obtains the stat category I want returned based on the postion passed into the function. If the player is a WR or TE I want 
 receiving stats, if the player is a QB I want passing stats, if the player is a RB I want rushing stats and if no position matches unknown is returned.
@@ -207,3 +401,31 @@ def obtain_playerST_category(position):
     else:
         return 'unknown'
     
+
+"""
+Running python -m obtaindata warm fills the caches ahead of time with warmcache.warm_cache. The work is handed to the imported obtaindata module
+rather than this __main__ copy of it, so the response cache and usage index that warm_cache uses are the same ones app.py would use.
+"""
+def main(arguments=None):
+    import argparse
+    parser= argparse.ArgumentParser(prog='python -m obtaindata', description="College football data tools")
+    commands= parser.add_subparsers(dest='command', required=True)
+    warm= commands.add_parser('warm', help="precompute team data, field images and summaries into the caches")
+    warm.add_argument('--year', required=True)
+    warm.add_argument('--conference', help="only warm the teams of this conference, such as SEC")
+    warm.add_argument('--teams', help="comma separated list of teams to warm instead of a conference")
+    warm.add_argument('--rate', type=float, help="most CFBD requests per second")
+    warm.add_argument('--workers', type=int, help="processes used to draw the field images")
+    warm.add_argument('--summaries', action='store_true', help="also request the chatgpt summaries (this costs money)")
+    warm.add_argument('--progress', help="progress file used to resume a run")
+    warm.add_argument('--restart', action='store_true', help="ignore the progress of an earlier run")
+    args= parser.parse_args(arguments)
+
+    from warmcache import warm_cache
+    teams= [team.strip() for team in args.teams.split(',') if team.strip()] if args.teams else None
+    progress= warm_cache(args.year, conference=args.conference, teams=teams, rate_limit=args.rate, workers=args.workers,
+                         summaries=args.summaries, progress_path=args.progress, restart=args.restart)
+    return 0 if progress is not None and not progress['failed'] else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+"""
+Overview: The following code is a content-addressed cache for the football field images drawn by victoryformation. The name of each image is
+a hash of the team, the year, the players_data list and the team_info dictionary, so the same query always maps to the same file and a repeat
+query is served straight from disk without drawing anything. Because every query gets its own file, users looking up different teams at the
+same time no longer overwrite each other's picture. The directory is kept under a size limit by deleting the least recently used images, and
+the modification time of a file is refreshed on every hit so it counts as recently used.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+"""
+The RenderCache class holds the directory of images. The key is a sha256 of a JSON dump with sorted keys so dictionaries that hold the same data
+always hash the same way, and the year is turned into a stripped string since it arrives from the form as a string and from the code as an int.
+variant holds whatever else changes the picture (obtaindata passes the background image and the renderer version) and is hashed along with the query.
+get_or_render returns the path of the image for the query. On a miss the render function is called with a temporary path in the same directory
+and the finished file is moved into place with os.replace, so a half written image is never served. The least recently used images are evicted
+after each new image is written.
+"""
+class RenderCache:
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, extension='png', variant=None):
+        self.directory= directory
+        self.variant= variant
+        self.max_bytes= max_bytes
+        self.extension= extension
+        self._lock= threading.Lock()
+        self._counters= {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def key(self, team, year, players_data, team_info):
+        content= json.dumps([team, str(year).strip(), players_data, team_info, self.variant], sort_keys=True, default=str, separators=(',', ':'))
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.{self.extension}")
+
+    def get_or_render(self, team, year, players_data, team_info, render):
+        path= self.path_for(self.key(team, year, players_data, team_info))
+        try:
+            os.utime(path)
+            with self._lock:
+                self._counters['hits']+= 1
+            return path
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._counters['misses']+= 1
+        temporary_path= os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp.{self.extension}")
+        try:
+            render(temporary_path)
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        self.evict()
+        return path
+
+    def clear(self):
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def evict(self):
+        with self._lock:
+            images= []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    try:
+                        information= entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    images.append((information.st_mtime, information.st_size, entry.path))
+            total_bytes= sum(size for _, size, _ in images)
+            for _, size, image_path in sorted(images):
+                if total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(image_path)
+                except FileNotFoundError:
+                    pass
+                total_bytes-= size
+                self._counters['evictions']+= 1
@@ -0,0 +1,101 @@
+"""
+Overview: The following code keeps the ChatGPT summaries that app.py asks for in a SQLite file. The prompt only depends on the team and the year,
+so once a summary has been paid for it can be shown again for free. Each summary is stored under the model, the team, the year and the version
+of the prompt, which means changing the model or the wording of the prompt (and bumping the prompt version) makes new summaries instead of
+showing old ones. The tokens that were used for the summary are stored next to it so the original cost can still be looked up.
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+"""
+The SummaryCache class opens a short lived connection for every read and write, which keeps it safe to use from flask's request threads and
+from the threads that stream summaries. The team is stored in lower case and the year as a stripped string so the same query typed slightly
+differently still finds the summary. The pending_streams table holds the one-time tokens home() hands to the summary stream: a token is made
+only after the team and year were found in CFBD, it expires after a few minutes and take_pending_stream deletes it, so each token starts at most
+one streamed (paid) summary. The table lives in the same file so a stream answered by another worker process still finds the token. An empty
+summary is never saved, and get skips any empty row written by older code, so a blank answer is requested again instead of being shown forever.
+"""
+class SummaryCache:
+    def __init__(self, db_path):
+        self.db_path= db_path
+        self._lock= threading.Lock()
+        self._counters= {'hits': 0, 'misses': 0}
+        directory= os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS summaries (model TEXT NOT NULL, team TEXT NOT NULL, year TEXT NOT NULL, "
+                               "prompt_version INTEGER NOT NULL, summary TEXT NOT NULL, prompt_tokens INTEGER NOT NULL, "
+                               "completion_tokens INTEGER NOT NULL, created_at REAL NOT NULL, "
+                               "PRIMARY KEY (model, team, year, prompt_version))")
+            connection.execute("CREATE TABLE IF NOT EXISTS pending_streams (token TEXT PRIMARY KEY, team TEXT NOT NULL, year TEXT NOT NULL, "
+                               "expires_at REAL NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    @staticmethod
+    def _key(model, team, year, prompt_version):
+        return model, str(team).strip().lower(), str(year).strip(), int(prompt_version)
+
+    def get(self, model, team, year, prompt_version):
+        try:
+            with closing(self._connect()) as connection:
+                row= connection.execute("SELECT summary FROM summaries WHERE model = ? AND team = ? AND year = ? AND prompt_version = ? "
+                                        "AND summary != ''",
+                                        self._key(model, team, year, prompt_version)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Summary cache read error: {e}")
+            return None
+        with self._lock:
+            self._counters['hits' if row else 'misses']+= 1
+        return row[0] if row else None
+
+    def put(self, model, team, year, prompt_version, summary, prompt_tokens=0, completion_tokens=0):
+        if not summary or not summary.strip():
+            return
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("INSERT OR REPLACE INTO summaries (model, team, year, prompt_version, summary, prompt_tokens, "
+                                   "completion_tokens, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (*self._key(model, team, year, prompt_version), summary, prompt_tokens, completion_tokens, time.time()))
+        except sqlite3.Error as e:
+            print(f"Summary cache write error: {e}")
+
+    def clear(self):
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM summaries")
+
+    def add_pending_stream(self, team, year, ttl=300):
+        token= secrets.token_urlsafe(16)
+        now= time.time()
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("DELETE FROM pending_streams WHERE expires_at <= ?", (now,))
+                connection.execute("INSERT INTO pending_streams (token, team, year, expires_at) VALUES (?, ?, ?, ?)",
+                                   (token, team, str(year), now + ttl))
+        except sqlite3.Error as e:
+            print(f"Summary cache write error: {e}")
+            return None
+        return token
+
+    def take_pending_stream(self, token):
+        try:
+            with closing(self._connect()) as connection, connection:
+                row= connection.execute("SELECT team, year, expires_at FROM pending_streams WHERE token = ?", (token,)).fetchone()
+                if row is None or connection.execute("DELETE FROM pending_streams WHERE token = ?", (token,)).rowcount != 1:
+                    return None
+        except sqlite3.Error as e:
+            print(f"Summary cache read error: {e}")
+            return None
+        team, year, expires_at= row
+        return (team, year) if expires_at > time.time() else None
@@ -0,0 +1,21 @@
+"""
+The tests import the top-level modules (apicache, obtaindata, ...) directly, so the repository folder is put on the import path. obtaindata and
+app read their settings from env variables when they are imported, so the caches they open are pointed at a temporary folder (the disk tier of
+the response cache is turned off) and the field background is given as an absolute path so the tests can run from any folder.
+"""
+import os
+import sys
+import tempfile
+
+repository_folder= os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repository_folder)
+
+test_folder= tempfile.mkdtemp(prefix='cfb-tests-')
+os.environ.setdefault('FIELD_BACKGROUND', os.path.join(repository_folder, 'static', 'football.jpg'))
+os.environ.setdefault('CFBD_CACHE_PATH', '')
+os.environ.setdefault('FIELD_RENDER_DIR', os.path.join(test_folder, 'renders'))
+os.environ.setdefault('CHATGPT_CACHE_PATH', os.path.join(test_folder, 'chatgpt_summaries.sqlite3'))
+os.environ.setdefault('LIMITS_PATH', os.path.join(test_folder, 'limits.sqlite3'))
+os.environ.setdefault('METRICS_PATH', os.path.join(test_folder, 'metrics.sqlite3'))
+os.environ.setdefault('CFBD_API_KEY', 'test')
+os.environ.setdefault('OPENAI_API_KEY', 'test')
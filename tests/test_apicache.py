@@ -0,0 +1,128 @@
+"""
+Tests for the response cache in apicache.py: the time to live chosen for current and finished seasons, the LRU eviction of the memory tier,
+the disk tier surviving a new cache object, the single-flight deduplication of concurrent identical misses, and request_the_api sending the
+same normalized parameters the key is made from.
+"""
+import datetime
+import threading
+import time
+from apicache import ResponseCache, ENDPOINT_TTLS, DEFAULT_TTLS, make_cache_key, season_is_current, ttl_for
+
+class CountingFetch:
+    def __init__(self, value=None, delay=0.0):
+        self.value= value
+        self.delay= delay
+        self.calls= 0
+        self.lock= threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls+= 1
+        time.sleep(self.delay)
+        return self.value if self.value is not None else {'call': self.calls}
+
+def test_season_is_current():
+    assert season_is_current(2024, today=datetime.date(2024, 10, 1))
+    assert season_is_current('2024', today=datetime.date(2025, 1, 15))
+    assert not season_is_current(2024, today=datetime.date(2025, 2, 1))
+    assert not season_is_current(2020, today=datetime.date(2024, 10, 1))
+    assert season_is_current('not a year')
+
+def test_ttl_for_finished_and_current_seasons():
+    this_year= datetime.date.today().year
+    assert ttl_for('records', {'year': this_year}) == ENDPOINT_TTLS['records'][0]
+    assert ttl_for('records', {'year': this_year - 5}) == ENDPOINT_TTLS['records'][1]
+    assert ttl_for('player/usage', {'year': str(this_year - 5)}) == ENDPOINT_TTLS['player/usage'][1]
+    assert ttl_for('unknown/endpoint', {'year': this_year - 5}) == DEFAULT_TTLS[1]
+
+def test_cache_key_normalizes_parameters():
+    assert make_cache_key('records', {'year': 2023, 'team': 'Alabama '}) == make_cache_key('/records/', {'team': 'Alabama', 'year': '2023'})
+    assert make_cache_key('records', {'year': 2023, 'team': None}) == make_cache_key('records', {'year': 2023})
+
+def test_memory_hit_and_failed_fetch_not_cached():
+    cache= ResponseCache(max_entries=8)
+    fetch= CountingFetch()
+    assert cache.get_or_fetch('records', {'year': 2020}, fetch) == {'call': 1}
+    assert cache.get_or_fetch('records', {'year': '2020'}, fetch) == {'call': 1}
+    assert fetch.calls == 1
+    assert cache.get_or_fetch('records', {'year': 2021}, lambda: None) is None
+    assert cache.get_or_fetch('records', {'year': 2021}, fetch) == {'call': 2}
+    stats= cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 3
+
+def test_expired_entries_are_fetched_again():
+    cache= ResponseCache(ttl_function=lambda endpoint, params: 0.05)
+    fetch= CountingFetch()
+    cache.get_or_fetch('records', {'year': 2020}, fetch)
+    time.sleep(0.1)
+    assert cache.get_or_fetch('records', {'year': 2020}, fetch) == {'call': 2}
+    assert cache.stats()['expired'] == 1
+
+def test_lru_eviction():
+    cache= ResponseCache(max_entries=2)
+    fetch= CountingFetch()
+    for year in (2020, 2021):
+        cache.get_or_fetch('records', {'year': year}, fetch)
+    cache.get_or_fetch('records', {'year': 2020}, fetch)
+    cache.get_or_fetch('records', {'year': 2022}, fetch)
+    assert cache.stats()['evictions'] == 1
+    calls= fetch.calls
+    cache.get_or_fetch('records', {'year': 2020}, fetch)
+    assert fetch.calls == calls
+    cache.get_or_fetch('records', {'year': 2021}, fetch)
+    assert fetch.calls == calls + 1
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    db_path= str(tmp_path / 'cache.sqlite3')
+    fetch= CountingFetch(value=[{'team': 'Alabama', 'total': {'wins': 12}}])
+    ResponseCache(db_path=db_path).get_or_fetch('records', {'year': 2020, 'team': 'Alabama'}, fetch)
+    cache= ResponseCache(db_path=db_path)
+    assert cache.get_or_fetch('records', {'year': 2020, 'team': 'Alabama'}, fetch) == fetch.value
+    assert fetch.calls == 1
+    assert cache.stats()['disk_hits'] == 1
+    cache.clear()
+    ResponseCache(db_path=db_path).get_or_fetch('records', {'year': 2020, 'team': 'Alabama'}, fetch)
+    assert fetch.calls == 2
+
+def test_single_flight_makes_one_upstream_call():
+    cache= ResponseCache()
+    fetch= CountingFetch(delay=0.2)
+    start_together= threading.Barrier(10)
+    results= []
+
+    def lookup():
+        start_together.wait()
+        results.append(cache.get_or_fetch('player/usage', {'year': 2020}, fetch))
+
+    threads= [threading.Thread(target=lookup) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetch.calls == 1
+    assert results == [{'call': 1}] * 10
+    stats= cache.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 9 and stats['coalesced'] == 9
+    assert stats['hit_ratio'] == 0.9
+
+def test_leader_rechecks_memory_after_a_fetch_finished():
+    class RacingCache(ResponseCache):
+        def _disk_get(self, key, now):
+            self._memory_put(key, {'fetched by': 'another thread'}, time.time() + 60)
+            return None
+
+    cache= RacingCache()
+    fetch= CountingFetch()
+    assert cache.get_or_fetch('records', {'year': 2020}, fetch) == {'fetched by': 'another thread'}
+    assert fetch.calls == 0
+
+def test_request_the_api_sends_the_normalized_params(monkeypatch):
+    import obtaindata
+    sent= []
+    monkeypatch.setattr(obtaindata, 'response_cache', ResponseCache())
+    monkeypatch.setattr(obtaindata, 'fetch_from_the_api', lambda endpoint, headers, params: sent.append(params) or [{'team': params['team']}])
+    assert obtaindata.request_the_api('records', {}, {'year': 2023, 'team': 'Alabama ', 'conference': None}) == [{'team': 'Alabama'}]
+    assert sent == [{'year': '2023', 'team': 'Alabama'}]
+    assert obtaindata.request_the_api('records', {}, {'year': '2023', 'team': 'Alabama'}) == [{'team': 'Alabama'}]
+    assert len(sent) == 1
@@ -0,0 +1,34 @@
+"""
+Tests for compare.py: stat_categories gives the same category as obtain_playerST_category for every position, and the season tables of a year are
+only built again when the cache hands back different payloads, including when one of the payloads keeps failing.
+"""
+import numpy as np
+import compare
+import obtaindata
+from apicache import ResponseCache
+from benchmarks.fixtures import full_season_usage
+from benchmarks.stub_server import StubCFBDServer
+
+def test_stat_categories_match_obtain_playerST_category():
+    positions= np.array(['QB', 'WR', 'TE', 'RB', 'OL', 'QB', 'None', 'RB', 'WR'])
+    expected= [obtaindata.obtain_playerST_category(position) for position in positions]
+    assert list(compare.stat_categories(positions)) == expected
+    assert len(compare.stat_categories(np.array([], dtype=str))) == 0
+
+def test_failed_payload_doesnt_rebuild_the_tables(monkeypatch):
+    server= StubCFBDServer(delay=0, usage_data=full_season_usage(team_count=4)).start()
+    monkeypatch.setattr(obtaindata, 'api_url', server.url)
+    monkeypatch.setattr(obtaindata, 'response_cache', ResponseCache())
+    monkeypatch.setattr(compare, 'season_tables', {})
+    request_the_api= obtaindata.request_the_api
+
+    def records_fail(endpoint, headers=None, params=None):
+        return None if endpoint == 'records' else request_the_api(endpoint, headers=headers, params=params)
+
+    monkeypatch.setattr(obtaindata, 'request_the_api', records_fail)
+    try:
+        tables= compare.get_season_tables({}, 2023)
+        assert tables is not None and tables.records == {}
+        assert compare.get_season_tables({}, 2023) is tables
+    finally:
+        server.stop()
@@ -0,0 +1,83 @@
+"""
+Tests for limits.py: a SharedTokenBucket lets a burst of capacity requests through and is shared by every bucket object with the same name, and
+for SharedBudget, reservations keep the money spent under the limit, the money spent starts over every period, and spent and
+remaining are plain reads that still answer while another process holds the write lock.
+"""
+import time
+import pytest
+import limits
+from limits import SharedBudget, SharedTokenBucket, immediate_transaction
+
+MARCH= time.mktime((2026, 3, 15, 12, 0, 0, 0, 0, 0)) - time.timezone
+APRIL= MARCH + 31 * 24 * 3600
+
+@pytest.fixture
+def clock(monkeypatch):
+    now= [MARCH]
+    monkeypatch.setattr(limits.time, 'time', lambda: now[0])
+    return now
+
+def test_token_bucket_is_shared_by_name(tmp_path, clock):
+    db_path= str(tmp_path / 'limits.sqlite3')
+    first= SharedTokenBucket('cfbd', 2, capacity=3, db_path=db_path)
+    second= SharedTokenBucket('cfbd', 2, capacity=3, db_path=db_path)
+    assert [first.try_acquire(), second.try_acquire(), first.try_acquire()] == [0.0, 0.0, 0.0]
+    assert second.try_acquire() == pytest.approx(0.5)
+    clock[0]+= 0.5
+    assert first.try_acquire() == 0.0
+
+def test_reservations_stay_within_the_limit(tmp_path, clock):
+    budget= SharedBudget('openai', 1.0, db_path=str(tmp_path / 'limits.sqlite3'))
+    first= budget.reserve(0.6)
+    assert first is not None
+    assert budget.reserve(0.6) is None
+    assert budget.remaining() == pytest.approx(0.4)
+    budget.commit(first, 0.25)
+    assert budget.spent() == pytest.approx(0.25)
+    assert budget.remaining() == pytest.approx(0.75)
+    budget.release(budget.reserve(0.5))
+    assert budget.remaining() == pytest.approx(0.75)
+
+def test_spent_starts_over_every_month(tmp_path, clock):
+    budget= SharedBudget('openai', 1.0, db_path=str(tmp_path / 'limits.sqlite3'))
+    assert budget.current_period() == '2026-03'
+    budget.commit(budget.reserve(0.9), 0.9)
+    assert budget.reserve(0.2) is None
+    clock[0]= APRIL
+    assert budget.current_period() == '2026-04'
+    assert budget.spent() == 0
+    assert budget.reserve(0.2) is not None
+
+def test_total_period_never_starts_over(tmp_path, clock):
+    budget= SharedBudget('openai', 1.0, db_path=str(tmp_path / 'limits.sqlite3'), period='total')
+    budget.commit(budget.reserve(0.9), 0.9)
+    clock[0]= APRIL
+    assert budget.spent() == pytest.approx(0.9)
+    budget.reset()
+    assert budget.spent() == 0
+
+def test_stale_reservations_hold_no_money(tmp_path, clock):
+    budget= SharedBudget('openai', 1.0, db_path=str(tmp_path / 'limits.sqlite3'), stale_after=60)
+    budget.reserve(0.9)
+    clock[0]+= 61
+    assert budget.remaining() == pytest.approx(1.0)
+    assert budget.reserve(0.9) is not None
+
+def test_reads_dont_wait_for_the_write_lock(tmp_path):
+    db_path= str(tmp_path / 'limits.sqlite3')
+    budget= SharedBudget('openai', 1.0, db_path=db_path)
+    budget.commit(budget.reserve(0.3), 0.3)
+    with immediate_transaction(db_path):
+        start= time.perf_counter()
+        assert budget.spent() == pytest.approx(0.3)
+        assert budget.remaining() == pytest.approx(0.7)
+        assert time.perf_counter() - start < 1
+
+def test_budget_command_resets_the_current_period(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('LIMITS_PATH', str(tmp_path / 'limits.sqlite3'))
+    budget= SharedBudget('openai', 1.0)
+    budget.commit(budget.reserve(0.4), 0.4)
+    assert limits.main(['budget', 'openai']) == 0
+    assert '0.4000 dollars spent' in capsys.readouterr().out
+    assert limits.main(['budget', 'openai', '--reset']) == 0
+    assert budget.spent() == 0
@@ -0,0 +1,85 @@
+"""
+Tests for the Prometheus output of metrics.py: cache events are exported as counters next to a gauge for the cache sizes, and every OpenAI
+completion adds its tokens to the per request histogram. The snapshots of every process are added up through the shared metrics file, so any
+worker answering /metrics reports the totals of all of them.
+"""
+import os
+import subprocess
+import sys
+import time
+import metrics
+from apicache import ResponseCache
+
+def sample_lines(name):
+    return [line for line in metrics.registry.render_prometheus().splitlines() if line.startswith(name)]
+
+def test_cache_events_are_counters():
+    cache= ResponseCache()
+    metrics.watch_cache('test_cache', cache)
+    cache.get_or_fetch('records', {'year': 2020}, lambda: {'wins': 1})
+    cache.get_or_fetch('records', {'year': 2020}, lambda: {'wins': 1})
+    output= metrics.registry.render_prometheus()
+    assert '# TYPE cache_events_total counter' in output
+    assert 'cache_events_total{cache="test_cache",event="hits"} 1' in output
+    assert 'cache_events_total{cache="test_cache",event="misses"} 1' in output
+    assert f'cache_state{{cache="test_cache",state="memory_entries",worker="{metrics.registry.process_name()}"}} 1' in output
+    assert 'event="memory_entries"' not in output
+
+def test_openai_tokens_per_request():
+    before= dict(line.rsplit(' ', 1) for line in sample_lines('openai_request_tokens_count'))
+    metrics.record_openai_usage(40, 300, 0.005)
+    output= metrics.registry.render_prometheus()
+    assert '# TYPE openai_request_tokens histogram' in output
+    after= dict(line.rsplit(' ', 1) for line in sample_lines('openai_request_tokens_count'))
+    for kind in ('prompt', 'completion'):
+        name= f'openai_request_tokens_count{{kind="{kind}"}}'
+        assert int(after[name]) == int(before.get(name, 0)) + 1
+    assert 'openai_request_tokens_bucket{kind="completion",le="250"}' in output
+
+def make_registry(path, retire_after=60):
+    registry= metrics.Registry(metrics.SharedSnapshots(str(path), retire_after=retire_after))
+    return registry, registry.counter('requests_total', "Requests.", ('route',)), registry.gauge('entries', "Entries."), \
+        registry.histogram('seconds', "Seconds.", buckets=(0.1, 1.0))
+
+def test_workers_are_added_up(tmp_path):
+    first, first_requests, first_entries, first_seconds= make_registry(tmp_path / 'metrics.sqlite3')
+    second, second_requests, second_entries, second_seconds= make_registry(tmp_path / 'metrics.sqlite3')
+    first_requests.inc(2, route='/')
+    second_requests.inc(3, route='/')
+    first_entries.set(4)
+    second_entries.set(5)
+    first_seconds.observe(0.05)
+    second_seconds.observe(0.5)
+    second.flush()
+    output= first.render_prometheus()
+    assert 'requests_total{route="/"} 5' in output
+    assert 'seconds_bucket{le="0.1"} 1' in output and 'seconds_bucket{le="1.0"} 2' in output and 'seconds_count 2' in output
+    assert f'entries{{worker="{first.process_name()}"}} 4' in output
+    assert f'entries{{worker="{second.process_name()}"}} 5' in output
+    assert second.render_prometheus().count('requests_total{route="/"} 5') == 1
+
+def test_exited_workers_keep_their_counts(tmp_path):
+    path= tmp_path / 'metrics.sqlite3'
+    exited, exited_requests, exited_entries, _= make_registry(path, retire_after=0.05)
+    exited_requests.inc(3, route='/')
+    exited_entries.set(7)
+    exited.flush()
+    time.sleep(0.1)
+    live, live_requests, _, _= make_registry(path, retire_after=0.05)
+    live_requests.inc(1, route='/')
+    output= live.render_prometheus()
+    assert 'requests_total{route="/"} 4' in output
+    assert 'entries{' not in output
+    time.sleep(0.1)
+    live_requests.inc(1, route='/')
+    assert 'requests_total{route="/"} 5' in live.render_prometheus()
+
+def test_another_process_shows_up_in_the_scrape(tmp_path):
+    path= str(tmp_path / 'metrics.sqlite3')
+    script= "import metrics; metrics.record_upstream_status('cfbd', 200); metrics.record_upstream_status('cfbd', 200)"
+    environment= dict(os.environ, METRICS_PATH=path)
+    subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=environment, check=True)
+    registry= metrics.Registry(metrics.SharedSnapshots(path))
+    upstream_responses= registry.counter('upstream_responses_total', "Responses.", ('upstream', 'status'))
+    upstream_responses.inc(upstream='cfbd', status=200)
+    assert 'upstream_responses_total{upstream="cfbd",status="200"} 3' in registry.render_prometheus()
@@ -0,0 +1,52 @@
+"""
+Tests for the CFBD data layer against the local stub server in benchmarks/stub_server.py. The response cache is swapped for one that keeps nothing,
+so every run goes to the stub. They check that the pooled session reuses its connections, that a team costs exactly the planned requests (one
+usage, one ppa, one stats request per category and one records request) and that the records request runs alongside the usage phase. A small usage payload is served so the time to build and parse it doesn't hide the overlap of the requests.
+"""
+import time
+import pytest
+import obtaindata
+from apicache import ResponseCache
+from benchmarks.fixtures import full_season_usage
+from benchmarks.stub_server import StubCFBDServer
+
+DELAY= 0.2
+TEAM= 'Team 007'
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server= StubCFBDServer(delay=DELAY, usage_data=full_season_usage(team_count=12)).start()
+    monkeypatch.setattr(obtaindata, 'api_url', server.url)
+    monkeypatch.setattr(obtaindata, 'response_cache', ResponseCache(max_entries=0))
+    yield server
+    server.stop()
+
+def planned_request_count(year, team):
+    top5= obtaindata.get_top5_usage_players({}, year, team)
+    return len(obtaindata.plan_player_requests(year, team, top5)) + 2
+
+def test_team_makes_the_planned_requests(stub_server):
+    expected= planned_request_count(2023, TEAM)
+    stub_server.reset_counts()
+    sorted_players, team_info= obtaindata.fetch_team_data({}, 2023, TEAM)
+    assert sorted_players and team_info
+    assert stub_server.counts['requests'] == expected
+
+def test_connections_are_reused_between_runs(stub_server):
+    obtaindata.fetch_team_data({}, 2023, TEAM)
+    stub_server.reset_counts()
+    runs= 3
+    for _ in range(runs):
+        obtaindata.fetch_team_data({}, 2023, TEAM)
+    assert stub_server.counts['requests'] > runs
+    assert stub_server.counts['connections'] <= 1
+
+def test_records_run_alongside_the_usage_phase(stub_server):
+    obtaindata.fetch_team_data({}, 2023, TEAM)
+    request_count= planned_request_count(2023, TEAM)
+    start= time.perf_counter()
+    sorted_players, team_info= obtaindata.fetch_team_data({}, 2023, TEAM)
+    elapsed= time.perf_counter() - start
+    assert sorted_players and team_info
+    assert elapsed < DELAY * request_count
+    assert elapsed < DELAY * 2.5
@@ -0,0 +1,48 @@
+"""
+Tests for the field renderer and its cache: the background has to be drawn upright (a picture that is red on top and blue on the bottom has to
+stay that way), the render cache key has to change with the background and the renderer version, and importing obtaindata has to find the
+background from any working folder.
+"""
+import os
+import subprocess
+import sys
+import numpy as np
+from PIL import Image
+import obtaindata
+from rendercache import RenderCache
+
+def test_background_is_drawn_upright(tmp_path):
+    background= np.zeros((200, 300, 3), dtype=np.uint8)
+    background[:100]= (255, 0, 0)
+    background[100:]= (0, 0, 255)
+    background_path= str(tmp_path / 'background.png')
+    Image.fromarray(background).save(background_path)
+    canvas= obtaindata.load_field_canvas(background_path)
+    image= np.asarray(canvas['image'].convert('RGB'))
+    position= canvas['position']
+    height, width= image.shape[:2]
+    x= int((position.x0 + position.width / 2) * width)
+    top_y= int((1 - position.y1 + position.height * 0.1) * height)
+    bottom_y= int((1 - position.y0 - position.height * 0.1) * height)
+    assert tuple(image[top_y, x]) == (255, 0, 0)
+    assert tuple(image[bottom_y, x]) == (0, 0, 255)
+
+def test_render_cache_key_includes_the_variant(tmp_path):
+    query= ('Kentucky', 2023, [{'name': 'Player 0'}], {'team': 'Kentucky'})
+    football= RenderCache(str(tmp_path), variant=['static/football.jpg', 2])
+    assert football.key(*query) == RenderCache(str(tmp_path), variant=['static/football.jpg', 2]).key(*query)
+    assert football.key(*query) != RenderCache(str(tmp_path), variant=['static/cfb_field.webp', 2]).key(*query)
+    assert football.key(*query) != RenderCache(str(tmp_path), variant=['static/football.jpg', 3]).key(*query)
+
+def test_render_field_image_uses_the_background_in_its_key():
+    assert obtaindata.render_cache.variant == [obtaindata.field_canvas['path'], obtaindata.RENDERER_VERSION]
+
+def test_import_works_from_another_folder(tmp_path):
+    environment= {name: value for name, value in os.environ.items() if name != 'FIELD_BACKGROUND'}
+    environment['PYTHONPATH']= os.path.dirname(os.path.abspath(obtaindata.__file__))
+    script= "import obtaindata; print(obtaindata.field_canvas['path']); print(obtaindata.static_folder)"
+    default= subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=environment, capture_output=True, text=True, check=True)
+    assert default.stdout.split() == [os.path.join(obtaindata.static_folder, 'football.jpg'), obtaindata.static_folder]
+    environment['FIELD_BACKGROUND']= os.path.join('static', 'cfb_field.webp')
+    relative= subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=environment, capture_output=True, text=True, check=True)
+    assert relative.stdout.split()[0] == os.path.join(obtaindata.static_folder, 'cfb_field.webp')
@@ -0,0 +1,98 @@
+"""
+Overview: The following code builds an index over the league-wide player/usage payload from CFBD. The payload holds every FBS player for a
+season, so scanning and sorting the whole list on every request is wasted work. The index is built once per year and stores the usage
+splits as NumPy arrays (columnar form) next to an integer code for each team. The rows are ordered by team and then by overall usage rate,
+which means the top players by overall usage for a team are simply the first rows of that team's slice. Any other usage split such as
+pass, rush or thirdDown is answered from the same arrays without downloading the payload again.
+"""
+import numpy as np
+
+"""
+These are the usage splits CFBD returns inside each player's usage dictionary. SPLIT_ALIASES lets the longer names passing and rushing be
+used for the pass and rush splits.
+"""
+USAGE_SPLITS= ('overall', 'pass', 'rush', 'firstDown', 'secondDown', 'thirdDown', 'standardDowns', 'passingDowns')
+SPLIT_ALIASES= {'passing': 'pass', 'rushing': 'rush'}
+
+def usage_value(player, split):
+    value= (player.get('usage') or {}).get(split)
+    return float(value) if value is not None else 0.0
+
+"""
+The UsageIndex class is made from the usage_data list returned by request_the_api. The original player dictionaries are kept in self.players
+so results look exactly like the dictionaries the rest of the code already works with. self.team_codes maps a team name to its integer code
+and self.team_slices maps that code to the start and stop of the team's rows in self.order. Ties are broken by the original payload order,
+which matches the stable sort that was used before the index existed. top_players returns copies of the n players on a team with the highest
+usage rate for the chosen split. For every split other than overall the team's rows are reordered with lexsort on the split values, which is
+cheap since a team only has around a hundred players. A ValueError is raised for a split CFBD doesn't provide. teams lists every team in the
+payload, or only the teams of one conference, since each player in the payload also carries their team's conference. top_rows answers the top n
+question for many teams at once without a loop over players: for every requested team it takes the first n rows of the team's slice of the order
+for the split (the order for a split other than overall is made the first time it is asked for and then kept). It returns the position of each row's
+team in the teams list together with the row numbers, which index into the usage, names and positions columns.
+"""
+class UsageIndex:
+    def __init__(self, usage_data):
+        self.players= usage_data
+        self.team_codes= {}
+        self.team_conferences= {}
+        for player in usage_data:
+            self.team_conferences.setdefault(player.get('team'), player.get('conference'))
+        team_column= np.fromiter((self.team_codes.setdefault(player.get('team'), len(self.team_codes)) for player in usage_data),
+                                 dtype=np.int32, count=len(usage_data))
+        self.usage= {split: np.fromiter((usage_value(player, split) for player in usage_data), dtype=np.float64, count=len(usage_data))
+                     for split in USAGE_SPLITS}
+        self.names= np.array([str(player.get('name')) for player in usage_data], dtype=str)
+        self.positions= np.array([str(player.get('position')) for player in usage_data], dtype=str)
+        self.team_column= team_column
+        row_numbers= np.arange(len(usage_data))
+        self.order= np.lexsort((row_numbers, -self.usage['overall'], team_column))
+        self._split_orders= {'overall': self.order}
+        sorted_teams= team_column[self.order]
+        self.team_starts= np.searchsorted(sorted_teams, np.arange(len(self.team_codes)), side='left')
+        self.team_stops= np.searchsorted(sorted_teams, np.arange(len(self.team_codes)), side='right')
+        self.team_slices= {code: (int(start), int(stop)) for code, (start, stop) in enumerate(zip(self.team_starts, self.team_stops))}
+
+    def __len__(self):
+        return len(self.players)
+
+    def teams(self, conference=None):
+        if conference is None:
+            return list(self.team_codes)
+        return [team for team in self.team_codes if (self.team_conferences.get(team) or '').lower() == conference.lower()]
+
+    def team_rows(self, team):
+        code= self.team_codes.get(team)
+        if code is None:
+            return self.order[:0]
+        start, stop= self.team_slices[code]
+        return self.order[start:stop]
+
+    def top_players(self, team, n=5, split='overall'):
+        split= SPLIT_ALIASES.get(split, split)
+        if split not in self.usage:
+            raise ValueError(f"Unknown usage split: {split}")
+        rows= self.team_rows(team)
+        if split != 'overall':
+            rows= rows[np.lexsort((rows, -self.usage[split][rows]))]
+        return [dict(self.players[row]) for row in rows[:n]]
+
+    def split_order(self, split):
+        split= SPLIT_ALIASES.get(split, split)
+        if split not in self.usage:
+            raise ValueError(f"Unknown usage split: {split}")
+        order= self._split_orders.get(split)
+        if order is None:
+            order= np.lexsort((np.arange(len(self.players)), -self.usage[split], self.team_column))
+            self._split_orders[split]= order
+        return order
+
+    def top_rows(self, teams, n=5, split='overall'):
+        order= self.split_order(split)
+        codes= np.array([self.team_codes.get(team, -1) for team in teams], dtype=np.int64)
+        known= codes >= 0
+        starts= np.where(known, self.team_starts[np.maximum(codes, 0)], 0)
+        stops= np.where(known, self.team_stops[np.maximum(codes, 0)], 0)
+        positions= starts[:, None] + np.arange(n)[None, :]
+        valid= positions < stops[:, None]
+        team_positions= np.nonzero(valid)[0]
+        return team_positions, order[positions[valid]]
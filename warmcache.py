@@ -0,0 +1,95 @@
+"""
+Overview: The following code fills the shared caches ahead of time so a nightly run can have popular teams ready before game-day traffic. It is
+started from the command line with python -m obtaindata warm --year 2023 --conference SEC. For every team the CFBD data is gathered with
+fetch_team_data (which stores the responses in the response cache), the field image is drawn into the render cache by a process pool since
+drawing is CPU-bound, and if asked the chatgpt summary is requested so it lands in the summary cache. The player/usage payload covers the whole
+league, so it is requested once for the year and its usage index is reused by every team (the team list of a conference also comes from it).
+Progress is written to a JSON file after each team finishes, so a run that stops partway picks up where it left off.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import obtaindata
+
+def default_progress_path(year, conference):
+    name= (conference or 'all').lower().replace(' ', '-')
+    return os.path.join('cache', f"warm-{year}-{name}.json")
+
+def load_progress(progress_path):
+    try:
+        with open(progress_path) as progress_file:
+            return json.load(progress_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'done': [], 'failed': []}
+
+def save_progress(progress_path, progress):
+    directory= os.path.dirname(progress_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path= progress_path + '.tmp'
+    with open(temporary_path, 'w') as progress_file:
+        json.dump(progress, progress_file, indent=2)
+    os.replace(temporary_path, progress_path)
+
+"""
+The following function asks for the chatgpt summary of a team through app.py's get_chatgpt_response, which returns the saved summary for free if
+it already exists. app is imported inside the function since app.py imports obtaindata and it is only needed when summaries are warmed. The summaries
+are paid for from the same shared budget as the web app, so they stop once the budget limit is reached.
+"""
+def warm_summary(team, year):
+    import app
+    chatgpt_response, cost_used= app.get_chatgpt_response(team, year)
+    return chatgpt_response is not None
+
+"""
+warm_cache walks the team list. The data for each team is gathered in this process while the process pool draws the images of the teams that were
+already gathered. Finished renders are collected after every team so the progress file stays up to date. A team is only marked done once its image
+exists (and its summary, when summaries are warmed). Teams that fail are written down as failed and tried again on the next run.
+"""
+def warm_cache(year, conference=None, teams=None, rate_limit=None, workers=None, summaries=False, progress_path=None, restart=False):
+    headers= obtaindata.cfbd_headers()
+    if headers is None:
+        return None
+    if rate_limit:
+        obtaindata.set_upstream_rate_limit(rate_limit)
+    usage_index= obtaindata.get_usage_index(headers, year)
+    if usage_index is None:
+        print(f"Unable to retrieve usage data for {year}")
+        return None
+    teams= teams or usage_index.teams(conference)
+    progress_path= progress_path or default_progress_path(year, conference)
+    progress= {'done': [], 'failed': []} if restart else load_progress(progress_path)
+    progress['failed']= []
+    remaining= [team for team in teams if team not in progress['done']]
+    print(f"Warming {len(remaining)} of {len(teams)} teams for {year}")
+
+    def record(team, succeeded):
+        progress['done' if succeeded else 'failed'].append(team)
+        save_progress(progress_path, progress)
+
+    def collect(pending, block):
+        finished, _= wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in finished:
+            team, summary_ready= pending.pop(future)
+            try:
+                future.result()
+                record(team, summary_ready)
+            except Exception as e:
+                print(f"Unable to draw the field for {team}: {e}")
+                record(team, False)
+
+    with ProcessPoolExecutor(max_workers=workers) as renderers:
+        pending= {}
+        for team in remaining:
+            sorted_players, team_info= obtaindata.fetch_team_data(headers, year, team)
+            if not sorted_players:
+                record(team, False)
+                continue
+            future= renderers.submit(obtaindata.render_field_image, team, year, sorted_players, team_info)
+            summary_ready= warm_summary(team, year) if summaries else True
+            pending[future]= (team, summary_ready)
+            collect(pending, block=False)
+        while pending:
+            collect(pending, block=True)
+    print(f"Warmed {len(progress['done'])} teams, {len(progress['failed'])} failed")
+    return progress